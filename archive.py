@@ -0,0 +1,183 @@
+'''
+SQLite message archive for BestBotEver!!!, with full-text search.
+WAL mode, an FTS5 trigram index (so Thai, which has no spaces between words,
+can be searched by substring), and a writer thread doing batched inserts.
+'''
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+ARCHIVE_PATH = "archive/messages.db"
+MIN_TERM_LENGTH = 3  # trigram index: shorter terms cannot be matched
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    author TEXT,
+    created REAL NOT NULL,
+    edited REAL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel ON messages(channel_id, id);
+CREATE INDEX IF NOT EXISTS messages_author ON messages(author_id, id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE OF content ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+UPSERT = """
+INSERT INTO messages (id, guild_id, channel_id, author_id, author, created, edited, content)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET content = excluded.content, edited = excluded.edited
+WHERE excluded.content IS NOT messages.content
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def fts_query(text: str):
+    """Every word of text as a quoted FTS5 phrase (all must match), None if a word is too short."""
+    terms = text.split()
+    if not terms or any(len(term) < MIN_TERM_LENGTH for term in terms):
+        return None
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+class MessageArchive:
+    """Archives messages through a writer thread, inserting in batched transactions.
+
+    add() only queues the row. The writer commits once it has batch_rows rows
+    or batch_interval seconds after the first row of a batch, whichever comes
+    first. Rows that do not fit in the queue are dropped and counted.
+    """
+
+    def __init__(self, path: str = ARCHIVE_PATH, batch_rows: int = 500, batch_interval: float = 0.25, maxsize: int = 50000):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.batch_interval = batch_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, name="message-archive", daemon=True)
+
+    def start(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with connect(self.path) as conn:
+            conn.executescript(SCHEMA)
+        conn.close()
+        self._thread.start()
+
+    def stop(self):
+        try:
+            self._queue.put(None, timeout=5)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=10)
+
+    def add(self, message, edited: bool = False):
+        row = (
+            message.id,
+            message.guild.id if message.guild else None,
+            message.channel.id,
+            message.author.id,
+            str(message.author),
+            message.created_at.timestamp(),
+            time.time() if edited else None,
+            message.content,
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    # ===== WRITER THREAD =====
+    def _run(self):
+        conn = connect(self.path)
+        try:
+            while True:
+                row = self._queue.get()
+                if row is None:
+                    return
+                batch = [row]
+                deadline = time.monotonic() + self.batch_interval
+                stop = False
+                while len(batch) < self.batch_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        row = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if row is None:
+                        stop = True
+                        break
+                    batch.append(row)
+                try:
+                    with conn:
+                        conn.executemany(UPSERT, batch)
+                    self.written += len(batch)
+                except sqlite3.Error as e:
+                    logging.error(f"Message archive failed to write {len(batch)} rows: {e}")
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    # ===== SEARCH =====
+    def search(self, text: str, guild_id=None, channel_id=None, author_id=None, page: int = 1, per_page: int = 10):
+        """(total matches, rows for the page); rows are (id, guild_id, channel_id, author, created, content), newest first.
+
+        Opens its own read connection (WAL lets it run next to the writer). Blocking, run it in a thread.
+        """
+        query = fts_query(text)
+        if query is None:
+            raise ValueError(f"search words need at least {MIN_TERM_LENGTH} characters")
+
+        where = ["messages_fts MATCH ?"]
+        params = [query]
+        # unary + keeps SQLite from driving the query off these indexes and probing FTS per row
+        for column, value in (("+m.guild_id", guild_id), ("+m.channel_id", channel_id), ("+m.author_id", author_id)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        clause = " AND ".join(where)
+        source = "messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+
+        conn = connect(self.path)
+        try:
+            total = conn.execute(f"SELECT count(*) FROM {source} WHERE {clause}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT m.id, m.guild_id, m.channel_id, m.author, m.created, m.content FROM {source} "
+                f"WHERE {clause} ORDER BY m.id DESC LIMIT ? OFFSET ?",
+                params + [per_page, (max(page, 1) - 1) * per_page],
+            ).fetchall()
+        finally:
+            conn.close()
+        return total, rows
@@ -0,0 +1,239 @@
+'''
+Offline benchmark for the moderation path (normalize + banned-word check).
+Runs without a Discord connection, against synthetic corpora and message
+content replayed from the log segments in log/ (plain or gzipped).
+
+Usage:
+    python bench/moderation_bench.py
+    python bench/moderation_bench.py --sizes 10 1000 10000 --messages 2000
+    python bench/moderation_bench.py --corpus replay --no-alloc
+    python bench/moderation_bench.py --fuzzy   # exact vs exact + fuzzy index vs linear fuzzy scan
+'''
+
+import argparse
+import json
+import os
+import random
+import re
+import string
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from logfiles import list_segments, open_log
+from moderation import (
+    BannedWordRuleset, ModerationEngine, bounded_levenshtein, normalize_for_matching, normalize_thai, normalize_word
+)
+
+
+# ===== CORPORA =====
+THAI_WORDS = ["สวัสดี", "ครับ", "วันนี้", "เล่น", "เกม", "กัน", "ไหม", "นิกก้า", "ข้าว", "อร่อย", "มาก", "เพื่อน"]
+HOMOGLYPHS = {"a": "а", "e": "е", "o": "о", "p": "р", "c": "с", "x": "х", "i": "і", "g": "ɡ", "n": "ո"}
+ZALGO_MARKS = [chr(c) for c in range(0x0300, 0x036F)]
+LOG_LINE_RE = re.compile(r"^\S+ \S+ \[INFO\] (?:\d+:)?.+? \(\d+\) in #.+? \(\d+\): (.*)$")
+
+
+def _ascii_sentence(rng, words=12):
+    return " ".join(
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9)))
+        for _ in range(words)
+    )
+
+
+def synthetic_corpus(kind: str, count: int, banned_words, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    banned_words = sorted(banned_words)
+    messages = []
+    for i in range(count):
+        if kind == "ascii":
+            text = _ascii_sentence(rng)
+        elif kind == "thai":
+            text = " ".join(rng.choice(THAI_WORDS) for _ in range(10))
+        elif kind == "zalgo":
+            text = "".join(
+                c + "".join(rng.choice(ZALGO_MARKS) for _ in range(rng.randint(1, 6)))
+                for c in _ascii_sentence(rng, 6)
+            )
+        elif kind == "homoglyph":
+            text = "".join(HOMOGLYPHS.get(c, c) if rng.random() < 0.5 else c for c in _ascii_sentence(rng))
+        elif kind == "paste":
+            text = "\n".join(_ascii_sentence(rng, 40) for _ in range(12))
+        else:
+            raise ValueError(f"unknown corpus: {kind}")
+
+        # roughly one message in ten carries a banned word
+        if banned_words and i % 10 == 0:
+            text += " " + rng.choice(banned_words)
+        messages.append(text)
+    return messages
+
+
+def replay_corpus(log_root: str = os.path.join(ROOT, "log")) -> list:
+    """Message content parsed from the bot's text logs (rotated segments included)."""
+    messages = []
+    for path in list_segments(log_root):
+        with open_log(path) as f:
+            for line in f:
+                m = LOG_LINE_RE.match(line.rstrip("\n"))
+                if m and m.group(1):
+                    messages.append(m.group(1))
+    return messages
+
+
+def synthetic_banned_words(base, size: int, seed: int = 0) -> set:
+    """Pad the real banned list with random words up to size entries."""
+    rng = random.Random(seed)
+    words = set(base)
+    while len(words) < size:
+        words.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+    return words
+
+
+# ===== MEASUREMENT =====
+def percentile(sorted_values, pct: float):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def clear_caches():
+    normalize_for_matching.cache_clear()
+    normalize_thai.cache_clear()
+
+
+def measure(check, messages, alloc: bool = True, reset=None) -> dict:
+    clear_caches()
+    if reset:
+        reset()
+    latencies = []
+    hits = 0
+    clock = time.perf_counter_ns
+    start = clock()
+    for text in messages:
+        t0 = clock()
+        if check(text):
+            hits += 1
+        latencies.append(clock() - t0)
+    elapsed = (clock() - start) / 1e9
+    latencies.sort()
+
+    alloc_bytes = None
+    if alloc:
+        # separate pass: tracemalloc slows everything down, so it is not timed
+        clear_caches()
+        if reset:
+            reset()
+        tracemalloc.start()
+        total = 0
+        for text in messages:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            check(text)
+            _, peak = tracemalloc.get_traced_memory()
+            total += peak - before
+        tracemalloc.stop()
+        alloc_bytes = total / max(len(messages), 1)
+
+    return {
+        "messages": len(messages),
+        "hits": hits,
+        "msg_per_s": len(messages) / elapsed if elapsed else 0,
+        "p50_us": percentile(latencies, 50) / 1000,
+        "p99_us": percentile(latencies, 99) / 1000,
+        "alloc_bytes": alloc_bytes,
+    }
+
+
+class StaticRules:
+    """Stands in for RulesetCache: one ruleset, no file."""
+
+    def __init__(self, ruleset):
+        self.ruleset = ruleset
+
+    def get(self, guild_id=None):
+        return self.ruleset
+
+
+def moderation_check(ruleset):
+    """ModerationEngine.check with exact (Latin + Thai) matching only."""
+    engine = ModerationEngine(StaticRules(ruleset), fuzzy=False)
+    return lambda text: engine.check(text).flagged
+
+
+def fuzzy_check(ruleset):
+    """ModerationEngine.check including the fuzzy index lookup for clean messages."""
+    engine = ModerationEngine(StaticRules(ruleset), fuzzy=True)
+    return lambda text: engine.check(text).flagged
+
+
+def linear_fuzzy_check(ruleset):
+    """Baseline: compare every word of the message with every fuzzy banned word."""
+    tolerances = ruleset.fuzzy.tolerances
+    engine = ModerationEngine(StaticRules(ruleset), fuzzy=False)
+
+    def check(text):
+        if engine.check(text).flagged:
+            return True
+        if ruleset.scan(normalize_for_matching(text))[1]:
+            return False
+        for token in text.split():
+            token = normalize_word(token)
+            for word, k in tolerances.items():
+                if bounded_levenshtein(token, word, k) <= k:
+                    return True
+        return False
+    return check
+
+
+def format_row(name, size, result):
+    alloc = f"{result['alloc_bytes']:>10,.0f}" if result["alloc_bytes"] is not None else f"{'-':>10}"
+    return (
+        f"{name:<11}{size:>8}{result['messages']:>8}{result['hits']:>7}"
+        f"{result['msg_per_s']:>12,.0f}{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}{alloc}"
+    )
+
+
+# ===== MAIN =====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the moderation path offline.")
+    parser.add_argument("--corpus", nargs="+", default=["ascii", "thai", "zalgo", "homoglyph", "paste", "replay"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[0, 100, 1000, 5000],
+                        help="banned list sizes (0 = the real banned_words.json)")
+    parser.add_argument("--messages", type=int, default=1000, help="synthetic messages per corpus")
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--fuzzy", action="store_true", help="also time the fuzzy index and a linear fuzzy scan")
+    parser.add_argument("--banned-file", default=os.path.join(ROOT, "banned_words.json"))
+    args = parser.parse_args(argv)
+
+    with open(args.banned_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    base_banned = set(data.get("banned_words", []))
+    whitelist = set(data.get("whitelisted_words", []))
+
+    replay = replay_corpus() if "replay" in args.corpus else []
+
+    print(f"{'corpus':<11}{'banned':>8}{'msgs':>8}{'hits':>7}{'msg/s':>12}{'p50 us':>10}{'p99 us':>10}{'alloc B':>10}")
+    for size in args.sizes:
+        banned = synthetic_banned_words(base_banned, size) if size else base_banned
+        ruleset = BannedWordRuleset(banned, whitelist, normalize_word)
+        check = moderation_check(ruleset)
+        for kind in args.corpus:
+            messages = replay if kind == "replay" else synthetic_corpus(kind, args.messages, base_banned)
+            if not messages:
+                continue
+            result = measure(check, messages, alloc=not args.no_alloc)
+            print(format_row(kind, len(ruleset.banned), result))
+            if args.fuzzy:
+                reset = ruleset._fuzzy_cache.clear
+                result = measure(fuzzy_check(ruleset), messages, alloc=not args.no_alloc, reset=reset)
+                print(format_row(" +index", len(ruleset.fuzzy), result))
+                result = measure(linear_fuzzy_check(ruleset), messages, alloc=False, reset=reset)
+                print(format_row(" +linear", len(ruleset.fuzzy), result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+'''
+Microbenchmark for the normalize_message pipeline.
+Compares the old per-call regex pipeline with the precompiled one in moderation.py.
+
+Usage: python bench/normalize_bench.py [seconds_per_case]
+'''
+
+import os
+import re
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unidecode import unidecode
+from moderation import normalize_message, normalize_for_matching
+
+
+# ===== LEGACY PIPELINE (as it was in main.py) =====
+def legacy_normalize_message(text: str) -> str:
+    text = str(text)
+    text = unidecode(text)
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r'[\s\W_]+', '', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[\u200B-\u200F\uFE00-\uFE0F\u2060-\u206F]', '', text)
+    text = ''.join(c for c in text if unicodedata.category(c)[0] != 'C')
+    text = re.sub(r'[\s\W_]+', '', text)
+
+    replacements = str.maketrans({
+        '0': 'o',
+        '1': 'i',
+        '2': 'z',
+        '3': 'e',
+        '4': 'a',
+        '5': 's',
+        '6': 'g',
+        '7': 't',
+        '8': 'b',
+        '9': 'g'
+    })
+    return text.translate(replacements)
+
+
+def legacy_normalize_for_matching(text: str) -> str:
+    content = legacy_normalize_message(text)
+    content = re.sub(r'[^a-z0-9]', '', content)
+    content = re.sub(r'(.)\1{2,}', r'\1', content)
+    return content
+
+
+# ===== CORPUS =====
+CASES = {
+    "ascii": "hey guys, is anyone up for minecraft tonight? server should be online at 8",
+    "leet/stretch": "n1666aaaaa pls st0p!!!! th1s 1s s0000 b0r1ng",
+    "unicode": "ｆｕｌｌｗｉｄｔｈ ｔｅｘｔ with café, naïve and ∂ifferent ѕуmbоlѕ",
+    "thai": "สวัสดีครับ วันนี้เล่นเกมกันไหม",
+    "zalgo": "z̴̢̛a̷̧͝l̶̨̛g̵̢͝o̸̡͠ t̷̨͝e̵̡͝x̸̢͠t̶̛̖",
+}
+
+
+def run(func, text, seconds, unique=False):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for i in range(200):
+            # suffix defeats the LRU cache so the uncached path is measured
+            func(f"{text} {count + i}" if unique else text)
+        count += 200
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+
+    for name, text in CASES.items():
+        if text.isascii():
+            # non-ASCII output differs on purpose: lookalikes fold to what they imitate
+            assert legacy_normalize_for_matching(text) == normalize_for_matching(text), name
+            assert legacy_normalize_message(text) == normalize_message(text), name
+
+    print(f"{'case':<14}{'legacy msg/s':>16}{'new msg/s':>16}{'cached msg/s':>16}{'speedup':>10}")
+    for name, text in CASES.items():
+        before = run(legacy_normalize_for_matching, text, seconds, unique=True)
+        after = run(normalize_for_matching, text, seconds, unique=True)
+        cached = run(normalize_for_matching, text, seconds)
+        print(f"{name:<14}{before:>16,.0f}{after:>16,.0f}{cached:>16,.0f}{after / before:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+'''
+Structured event log for BestBotEver!!!: messages, edits, moderation actions
+and commands as JSON lines, one segment per hour, plus a per-day index of
+which hours each user and channel appear in.
+
+events/<YYYY-MM-DD>/events_<HH>.jsonl   one compact JSON record per line
+events/<YYYY-MM-DD>/index.json          {"users": {id: [hours]}, "channels": {id: [hours]}}
+'''
+
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+
+EVENTS_ROOT = "events"
+
+
+def _dump(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _write_json_atomic(path: str, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_dump(data))
+    os.replace(tmp_path, path)
+
+
+class EventSink:
+    """JSON-lines event writer with a user/channel/hour index.
+
+    emit() only puts the record on a bounded queue; a writer thread appends
+    it to the hour's segment and updates that day's index, which is saved at
+    most every flush_interval seconds (queries can lag by that much).
+    Records that do not fit in the queue are dropped and counted.
+    """
+
+    def __init__(self, root: str = EVENTS_ROOT, flush_interval: float = 1.0, maxsize: int = 20000):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, name="event-sink", daemon=True)
+        self._file = None
+        self._file_hour = None
+        self._day = None
+        self._index = None  # index of self._day being written
+        self._index_dirty = False
+
+    def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._thread.start()
+
+    def stop(self):
+        try:
+            self._queue.put(None, timeout=5)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=10)
+
+    def emit(self, kind: str, **fields):
+        """Queue one event. Field names are kept short on purpose (g/c/u = guild/channel/user IDs)."""
+        record = {"t": round(time.time(), 3), "k": kind}
+        record.update((k, v) for k, v in fields.items() if v is not None)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    # ===== WRITER THREAD =====
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = False
+            if record is None:
+                self._safe_flush()
+                self._close()
+                return
+            if record:
+                try:
+                    self._write(record)
+                except Exception as e:
+                    logging.error(f"Event sink failed to write a record: {e}")
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._safe_flush()
+                last_flush = time.monotonic()
+
+    def _safe_flush(self):
+        # a failed index write is retried next round instead of ending the thread
+        try:
+            self._flush()
+        except Exception as e:
+            logging.error(f"Event sink failed to flush: {e}")
+
+    def _write(self, record):
+        stamp = datetime.fromtimestamp(record["t"])
+        hour = stamp.strftime("%Y-%m-%d_%H")
+        if hour != self._file_hour:
+            self._open(stamp, hour)
+        self._file.write(_dump(record) + "\n")
+        self.written += 1
+
+        hour_of_day = stamp.hour
+        for key, field in (("users", "u"), ("channels", "c")):
+            value = record.get(field)
+            if value is None:
+                continue
+            hours = self._index[key].setdefault(str(value), [])
+            if not hours or hours[-1] != hour_of_day:
+                hours.append(hour_of_day)
+                self._index_dirty = True
+
+    def _open(self, stamp: datetime, hour: str):
+        self._flush()
+        self._close()
+        day = stamp.strftime("%Y-%m-%d")
+        folder = os.path.join(self.root, day)
+        os.makedirs(folder, exist_ok=True)
+        if day != self._day:
+            self._day = day
+            self._index = load_index(self.root, day)
+        self._file = open(os.path.join(folder, f"events_{stamp.hour:02d}.jsonl"), "a", encoding="utf-8")
+        self._file_hour = hour
+
+    def _flush(self):
+        if self._file:
+            self._file.flush()
+        if self._index_dirty:
+            _write_json_atomic(os.path.join(self.root, self._day, "index.json"), self._index)
+            self._index_dirty = False
+
+    def _close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._file_hour = None
+
+    # ===== QUERIES =====
+    def query(self, user_id=None, channel_id=None, days: int = 7, kinds=None, limit: int = 50) -> list:
+        """Newest-first records for a user and/or channel over the last `days` days.
+
+        Only the hour segments the day indexes list for that user/channel are
+        read. Blocking, run it in a thread.
+        """
+        results = []
+        today = datetime.now().date()
+        for offset in range(days):
+            day = (today - timedelta(days=offset)).strftime("%Y-%m-%d")
+            index = load_index(self.root, day)
+            hours = None
+            for key, value in (("users", user_id), ("channels", channel_id)):
+                if value is None:
+                    continue
+                listed = set(index[key].get(str(value), ()))
+                hours = listed if hours is None else hours & listed
+            if hours is None:
+                hours = set(range(24))
+
+            for hour in sorted(hours, reverse=True):
+                path = os.path.join(self.root, day, f"events_{hour:02d}.jsonl")
+                matches = []
+                for record in read_segment(path):
+                    if user_id is not None and record.get("u") != user_id:
+                        continue
+                    if channel_id is not None and record.get("c") != channel_id:
+                        continue
+                    if kinds and record.get("k") not in kinds:
+                        continue
+                    matches.append(record)
+                results.extend(reversed(matches))
+                if len(results) >= limit:
+                    return results[:limit]
+        return results
+
+
+def load_index(root: str, day: str) -> dict:
+    path = os.path.join(root, day, "index.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        index = {}
+    index.setdefault("users", {})
+    index.setdefault("channels", {})
+    return index
+
+
+def read_segment(path: str):
+    """Records of one hour segment, skipping a torn last line."""
+    if not os.path.isfile(path):
+        return
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
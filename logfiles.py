@@ -0,0 +1,350 @@
+'''
+Log file handling for BestBotEver!!!: rotation, gzip compression, retention
+and reading segments back. Logs live in log/<YYYY-MM-DD>/log_<HH-MM-SS>.txt;
+closed segments become log_<HH-MM-SS>.txt.gz.
+'''
+
+from collections import deque
+from datetime import datetime, timedelta
+from logging.handlers import BaseRotatingHandler
+import gzip
+import io
+import os
+import queue
+import re
+import shutil
+import threading
+
+
+LOG_ROOT = "log"
+LOG_SUFFIXES = (".txt", ".txt.gz")
+
+
+def open_log(path: str):
+    """Text stream over a log segment, compressed or not."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def resolve_log(path: str):
+    """path, or its compressed version if the segment was rotated since; None if neither exists."""
+    for candidate in (path, path + ".gz", path[:-3] if path.endswith(".gz") else None):
+        if candidate and os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def segment_key(name: str) -> list:
+    """Sort key that keeps log_x_10.txt after log_x_9.txt."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def list_segments(root: str = LOG_ROOT) -> list:
+    """All log segments under root, oldest first (date folders and HH-MM-SS names sort chronologically)."""
+    segments = []
+    if not os.path.isdir(root):
+        return segments
+    for day in sorted(os.listdir(root)):
+        folder = os.path.join(root, day)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder), key=segment_key):
+            if name.endswith(LOG_SUFFIXES):
+                segments.append(os.path.join(folder, name))
+    return segments
+
+
+# ===== ROTATION =====
+class DailySizeRotatingHandler(BaseRotatingHandler):
+    """Starts a new segment when the day changes or the current one reaches max_bytes.
+
+    The closed segment's path is passed to on_rotate (the compressor), so the
+    logging thread never compresses anything itself.
+    """
+
+    def __init__(self, root: str = LOG_ROOT, max_bytes: int = 10 * 1024 * 1024, on_rotate=None, encoding: str = "utf-8"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.on_rotate = on_rotate
+        self.day = None
+        super().__init__(self._new_path(datetime.now()), "a", encoding=encoding)
+
+    def _new_path(self, now: datetime) -> str:
+        folder = os.path.join(self.root, now.strftime("%Y-%m-%d"))
+        os.makedirs(folder, exist_ok=True)
+        base = os.path.join(folder, f"log_{now.strftime('%H-%M-%S')}")
+        path, n = base + ".txt", 1
+        while os.path.exists(path) or os.path.exists(path + ".gz"):
+            path, n = f"{base}_{n}.txt", n + 1
+        self.day = now.date()
+        return path
+
+    def shouldRollover(self, record) -> bool:
+        if datetime.fromtimestamp(record.created).date() != self.day:
+            return True
+        return bool(self.max_bytes) and self.stream is not None and self.stream.tell() >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        closed = self.baseFilename
+        self.baseFilename = os.path.abspath(self._new_path(datetime.now()))
+        self.stream = self._open()
+        if self.on_rotate:
+            self.on_rotate(closed)
+
+
+# ===== COMPRESSION / RETENTION =====
+class LogCompressor:
+    """Background thread that gzips closed segments and enforces the retention policy.
+
+    Retention deletes the oldest segments (never the active one) until the
+    log folder fits in max_total_bytes, and anything older than max_age_days
+    (0 keeps segments regardless of age).
+    """
+
+    def __init__(self, root: str = LOG_ROOT, max_total_bytes: int = 256 * 1024 * 1024, max_age_days: int = 0, active=None):
+        self.root = root
+        self.max_total_bytes = max_total_bytes
+        self.max_age_days = max_age_days
+        self.active = active  # callable returning the path being written, if any
+        self.compressed = 0
+        self.deleted = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="log-compressor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join(timeout=30)
+
+    def submit(self, path: str):
+        self._queue.put(path)
+
+    def submit_leftovers(self):
+        """Queue uncompressed segments left behind by earlier runs."""
+        active = self._active_path()
+        for path in list_segments(self.root):
+            if path.endswith(".txt") and os.path.abspath(path) != active:
+                self.submit(path)
+        self._queue.put("")  # retention pass even if nothing needed compressing
+
+    def _active_path(self):
+        path = self.active() if self.active else None
+        return os.path.abspath(path) if path else None
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            try:
+                if path:
+                    self.compress(path)
+                if self._queue.empty():
+                    self.enforce_retention()
+            except Exception as e:
+                # logging from here would feed the thing being compressed
+                print(f"Log compression failed for {path}: {e}")
+
+    def compress(self, path: str):
+        if not os.path.isfile(path):
+            return
+        tmp_path = path + ".gz.tmp"
+        with open(path, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp_path, path + ".gz")
+        os.remove(path)
+        self.compressed += 1
+
+    def enforce_retention(self):
+        active = self._active_path()
+        segments = [p for p in list_segments(self.root) if os.path.abspath(p) != active]
+        sizes = {p: os.path.getsize(p) for p in segments}
+        total = sum(sizes.values())
+        if active and os.path.isfile(active):
+            total += os.path.getsize(active)
+        cutoff = datetime.now() - timedelta(days=self.max_age_days) if self.max_age_days else None
+
+        for path in segments:  # oldest first
+            too_old = cutoff is not None and datetime.fromtimestamp(os.path.getmtime(path)) < cutoff
+            if not too_old and (not self.max_total_bytes or total <= self.max_total_bytes):
+                break
+            os.remove(path)
+            total -= sizes[path]
+            self.deleted += 1
+            folder = os.path.dirname(path)
+            if not os.listdir(folder):
+                os.rmdir(folder)
+
+
+# ===== READING =====
+def _trim_tail(text: str, chars: int) -> str:
+    if len(text) <= chars:
+        return text
+    text = text[-chars:]
+    newline = text.find("\n")
+    if 0 <= newline < len(text) - 1:
+        text = text[newline + 1:]
+    return text
+
+
+def tail_log(path: str, chars: int = 1900) -> str:
+    """Last chars characters of a segment, starting at a line boundary when possible.
+
+    Plain segments are read backwards from the end in blocks; gzip has no
+    random access, so compressed ones are streamed keeping only the tail.
+    """
+    if path.endswith(".gz"):
+        tail = deque()
+        size = 0
+        with open_log(path) as f:
+            for line in f:
+                tail.append(line)
+                size += len(line)
+                while size - len(tail[0]) >= chars:
+                    size -= len(tail.popleft())
+        return _trim_tail("".join(tail), chars)
+
+    block = 4096
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        start = end
+        data = b""
+        # UTF-8 is at most 4 bytes per character
+        while start > 0 and len(data) < chars * 4:
+            step = min(block, start)
+            start -= step
+            f.seek(start)
+            data = f.read(step) + data
+            if len(data.decode("utf-8", errors="replace")) > chars:
+                break
+    return _trim_tail(data.decode("utf-8", errors="replace"), chars)
+
+
+def gzip_bytes(path: str) -> bytes:
+    """Compressed copy of a segment, for uploads."""
+    if path.endswith(".gz"):
+        with open(path, "rb") as f:
+            return f.read()
+    buffer = io.BytesIO()
+    with open(path, "rb") as src, gzip.GzipFile(filename=os.path.basename(path), mode="wb", fileobj=buffer) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    return buffer.getvalue()
+
+
+# ===== INDEX / SEARCH =====
+class LogIndex:
+    """Cached listing of log/<date>/ folders and their segments.
+
+    A folder is only listed again when its mtime changes (a segment was
+    created, compressed or deleted), so !seelog recent and !greplog do not
+    sort full directory listings on every call.
+    """
+
+    def __init__(self, root: str = LOG_ROOT):
+        self.root = root
+        self._days = None
+        self._root_mtime = None
+        self._segments = {}  # day -> (folder mtime, [names oldest first])
+
+    def days(self) -> list:
+        try:
+            mtime = os.stat(self.root).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if self._days is None or mtime != self._root_mtime:
+            self._days = sorted(
+                d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d))
+            )
+            self._root_mtime = mtime
+            self._segments = {d: v for d, v in self._segments.items() if d in self._days}
+        return self._days
+
+    def segments(self, day: str) -> list:
+        folder = os.path.join(self.root, day)
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        cached = self._segments.get(day)
+        if cached is None or cached[0] != mtime:
+            names = sorted((n for n in os.listdir(folder) if n.endswith(LOG_SUFFIXES)), key=segment_key)
+            cached = (mtime, names)
+            self._segments[day] = cached
+        return cached[1]
+
+    def latest(self):
+        """(day, name) of the newest segment, or None."""
+        for day in reversed(self.days()):
+            names = self.segments(day)
+            if names:
+                return day, names[-1]
+        return None
+
+    def paths(self, start: str = None, end: str = None) -> list:
+        """Segment paths with start <= day <= end (YYYY-MM-DD strings), oldest first."""
+        paths = []
+        for day in self.days():
+            if (start and day < start) or (end and day > end):
+                continue
+            paths.extend(os.path.join(self.root, day, name) for name in self.segments(day))
+        return paths
+
+
+GREP_CHUNK_CHARS = 1024 * 1024
+
+
+def compile_grep_pattern(pattern: str):
+    """The case-insensitive regex grep_logs runs; raises re.error for a bad pattern."""
+    return re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+
+
+def _grep_stream(f, regex, limit: int):
+    """Matching lines of a text stream, read in chunks cut at line boundaries."""
+    carry = ""
+    while True:
+        chunk = f.read(GREP_CHUNK_CHARS)
+        text = carry + chunk
+        if chunk:
+            cut = text.rfind("\n")
+            if cut < 0:
+                carry = text  # one very long line, keep reading
+                continue
+            text, carry = text[:cut], text[cut + 1:]
+        last_line = -1
+        for match in regex.finditer(text):
+            line_start = text.rfind("\n", 0, match.start()) + 1
+            if line_start == last_line:
+                continue  # several hits on one line
+            last_line = line_start
+            line_end = text.find("\n", match.end())
+            if line_end < 0:
+                line_end = len(text)
+            yield text[line_start:line_end].rstrip("\r")
+            limit -= 1
+            if limit <= 0:
+                return
+        if not chunk:
+            return
+
+
+def grep_logs(paths, pattern, limit: int = 50):
+    """Yield (path, line) for lines matching pattern (a compile_grep_pattern() regex or a string), at most limit.
+
+    Segments, compressed or not, are read in 1 MB chunks and each chunk is
+    searched in one regex pass, so memory use does not depend on log size.
+    """
+    regex = pattern if isinstance(pattern, re.Pattern) else compile_grep_pattern(pattern)
+    for path in paths:
+        if limit <= 0:
+            return
+        with open_log(path) as f:
+            for line in _grep_stream(f, regex, limit):
+                yield path, line
+                limit -= 1
@@ -6,10 +6,12 @@ from discord import FFmpegPCMAudio, FFmpegOpusAudio
 from discord.ext import commands, tasks
 from datetime import datetime, timedelta
 import json
-import unicodedata
 import re
 import asyncio
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import atexit
 import threading
 import platform
 import socket
@@ -18,21 +20,29 @@ import io
 import psutil
 import GPUtil
 import traceback
+import typing
 from mcstatus import BedrockServer
 from prompt_toolkit import prompt
 from prompt_toolkit.patch_stdout import patch_stdout
 import tkinter as tk
 from tkinter import filedialog
 import shutil
+from collections import deque
 import colorama
 import hashlib
+import gzip
 import time
 import yt_dlp
-from homoglyphs import Homoglyphs
 from ftfy import fix_text
 import subprocess
-from unidecode import unidecode
 from gtts import gTTS
+from moderation import ContentDigestCache, ImmunityIndex, ModerationEngine, RaidDetector, RulesetCache, normalize_word
+from ocr import AttachmentScanner, ImageBlocklist
+from archive import MessageArchive
+from events import EventSink
+from userstore import USER_DB_PATH, JsonUserStore, SqliteUserStore
+from snapshots import DELTA_SUFFIX, MANIFEST_FILE, UserSnapshots
+from logfiles import LOG_ROOT, DailySizeRotatingHandler, LogCompressor, LogIndex, compile_grep_pattern, grep_logs, gzip_bytes, resolve_log, tail_log
 
 try:
     # ===== SETUP =====
@@ -133,23 +143,110 @@ try:
             except Exception:
                 self.handleError(record)
 
-    log_dir = f"log/{datetime.now().strftime('%Y-%m-%d')}"
-    os.makedirs(log_dir, exist_ok=True)
+    class BufferedConsoleHandler(PTKHandler):
+        """Console sink of the log listener: prints buffered lines in one redraw.
 
-    # Log file path
-    log_file = f"{log_dir}/log_{datetime.now().strftime('%H-%M-%S')}.txt"
+        Keeps only the newest `capacity` lines; when the console can't keep up
+        the oldest are dropped (they are still in the log file) and counted.
+        """
+
+        def __init__(self, capacity: int = 500, interval: float = 0.25):
+            super().__init__()
+            self.lines = deque(maxlen=capacity)
+            self.interval = interval
+            self.dropped = 0
+            self._unreported = 0
+            self._last_flush = time.monotonic()
+
+        def emit(self, record):
+            try:
+                if len(self.lines) == self.lines.maxlen:
+                    self.dropped += 1
+                    self._unreported += 1
+                self.lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+            if time.monotonic() - self._last_flush >= self.interval:
+                self.flush()
+
+        def flush(self):
+            self._last_flush = time.monotonic()
+            if not self.lines:
+                return
+            lines = list(self.lines)
+            self.lines.clear()
+            if self._unreported:
+                lines.insert(0, f"... {self._unreported} console log lines dropped, see the log file")
+                self._unreported = 0
+            try:
+                with self.lock:
+                    from prompt_toolkit import print_formatted_text
+                    print_formatted_text("\n".join(lines))
+            except Exception:
+                pass
+
+    class LogQueueHandler(QueueHandler):
+        """Hands records to the listener thread without ever blocking the caller."""
+
+        def __init__(self, log_queue):
+            super().__init__(log_queue)
+            self.dropped = 0
+
+        def prepare(self, record):
+            # formatting happens in the listener thread; the bot logs f-strings, so nothing is left to merge
+            return record
+
+        def enqueue(self, record):
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    class LogListener(QueueListener):
+        """Background thread that writes the log file and redraws the console."""
+
+        def dequeue(self, block):
+            if block and self.queue.empty():
+                # idle: show whatever the console sink is still holding
+                console_handler.flush()
+            return self.queue.get(block)
+
+    # log/<date>/log_<time>.txt, a new segment every day and every LOG_MAX_BYTES;
+    # closed segments are gzipped in the background and the oldest deleted past the retention cap
+    LOG_MAX_BYTES = 10 * 1024 * 1024
+    LOG_RETENTION_BYTES = 256 * 1024 * 1024
+    LOG_RETENTION_DAYS = 0  # 0 = only the size cap applies
+    LOG_UPLOAD_GZIP_BYTES = 1024 * 1024   # larger logs are gzipped before !seelog/!greplog upload them
+    LOG_UPLOAD_MAX_BYTES = 8 * 1024 * 1024
+    GREPLOG_LIMIT = 100
+
+    # Cached listing of log/<date>/ folders for !seelog recent and !greplog
+    LOG_INDEX = LogIndex(LOG_ROOT)
+
+    log_compressor = LogCompressor(
+        LOG_ROOT, LOG_RETENTION_BYTES, LOG_RETENTION_DAYS, active=lambda: file_handler.baseFilename
+    )
 
     # Create handlers manually
-    file_handler = logging.FileHandler(log_file, encoding="utf-8")
-    console_handler = PTKHandler()
+    file_handler = DailySizeRotatingHandler(LOG_ROOT, LOG_MAX_BYTES, on_rotate=log_compressor.submit)
+    console_handler = BufferedConsoleHandler()
+    log_compressor.start()
+    log_compressor.submit_leftovers()
 
     # Formatter (you can adjust the format)
     formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
+    # The event loop only enqueues records; the listener thread formats, writes and redraws
+    LOG_QUEUE = queue.Queue(maxsize=50000)
+    queue_handler = LogQueueHandler(LOG_QUEUE)
+    log_listener = LogListener(LOG_QUEUE, file_handler, console_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
     # Configure root logger
-    logging.basicConfig(level=logging.INFO, handlers=[file_handler, console_handler])
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
 
     log = logging.getLogger(__name__)
 
@@ -157,19 +254,27 @@ try:
     CONFIG_FILE = "config.json"
     
     def get_latest_userinfo_file():
+        # The manifest remembers the live user file, so the folder is only listed once
+        if USER_SNAPSHOTS.current:
+            return USER_SNAPSHOTS.current
+
         folder = "userdata"
         os.makedirs(folder, exist_ok=True)
 
-        files = [f for f in os.listdir(folder) if f.endswith(".json")]
+        files = [
+            f for f in os.listdir(folder)
+            if f.endswith(".json") and not f.endswith(DELTA_SUFFIX) and f != MANIFEST_FILE
+        ]
         if not files:
             # No file found — create a default one
-            return os.path.join(folder, "uinfo_latest.json")
-
-        # Sort chronologically (filenames start with date)
-        files.sort()
-        return os.path.join(folder, files[-1])  # most recent
+            path = os.path.join(folder, "uinfo_latest.json")
+        else:
+            # Sort chronologically (filenames start with date)
+            files.sort()
+            path = os.path.join(folder, files[-1])  # most recent
 
-    USER_INFO_FILE = get_latest_userinfo_file()
+        USER_SNAPSHOTS.set_current(path)
+        return path
 
     def load_json(file_path, default=None):
         if not os.path.exists(file_path):
@@ -194,31 +299,59 @@ try:
             logging.error(f"Failed to write to {file_path}: {e}")
 
     def load_userinfo():
+        # Fall back to the newest snapshot if the live file is gone
+        if not os.path.isfile(USER_INFO_FILE):
+            restored = USER_SNAPSHOTS.load_latest()
+            if restored:
+                logging.warning(f"{USER_INFO_FILE} not found, restored {len(restored['discord_users'])} users from the newest snapshot")
+                return restored
         return load_json(USER_INFO_FILE, default={"discord_users": {}, "last_saved": None})
 
-    def save_userinfo(data, session_id):
-        # Ensure userdata folder exists
-        os.makedirs("userdata", exist_ok=True)
-
-        # Format: YYYY-MM-DD_HH-MM-SS-sessionID
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        file_path = f"userdata/{timestamp}-{session_id}.json"
-
-        # Save JSON data
+    async def save_userinfo(session_id, full=False):
+        # Base snapshot every few days, otherwise only the users that changed
         try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
-            logging.info(f"User info saved to {file_path}")
+            saved = await asyncio.to_thread(USER_SNAPSHOTS.save, USERS, session_id, full)
         except Exception as e:
-            logging.error(f"Failed to write to {file_path}: {e}")
+            logging.error(f"Failed to write user snapshot: {e}")
+            return
+        if saved is None:
+            logging.info("No user changes since the last snapshot")
+        else:
+            snapshot_id, kind, count = saved
+            logging.info(f"User snapshot {snapshot_id} saved ({kind}, {count} users)")
 
     config_data = load_json(CONFIG_FILE)
     if not config_data:
         exit(1)
 
-    user_info = load_json(USER_INFO_FILE, default={"discord_users": {}, "last_saved": None})
-    if not user_info or "discord_users" not in user_info:
-        user_info = {"discord_users": {}, "last_saved": None}
+    # "json" keeps every user in memory; "sqlite" keeps them in userdata/users.db
+    USER_CONFIG = config_data.setdefault(
+        "users", {"backend": "json", "base_snapshot_days": 7, "keep_base_snapshots": 8, "keep_snapshot_days": 0}
+    )
+    USER_BACKEND = USER_CONFIG.get("backend", "json")
+    USER_SNAPSHOTS = UserSnapshots(
+        "userdata",
+        base_interval_days=USER_CONFIG.get("base_snapshot_days", 7),
+        keep_bases=USER_CONFIG.get("keep_base_snapshots", 8),
+        keep_days=USER_CONFIG.get("keep_snapshot_days", 0),
+    )
+    USER_INFO_FILE = get_latest_userinfo_file()
+    if USER_BACKEND == "sqlite":
+        USERS = SqliteUserStore(USER_DB_PATH)
+        if USERS.count() == 0 and (os.path.isfile(USER_INFO_FILE) or USER_SNAPSHOTS.manifest["latest"]):
+            USERS.import_json(load_userinfo() or {})
+            logging.info(f"Imported {USERS.count()} users into {USER_DB_PATH}")
+    else:
+        user_info = load_userinfo()
+        if not user_info or "discord_users" not in user_info:
+            user_info = {"discord_users": {}, "last_saved": None}
+
+        # Write-behind: changed records are saved by a background thread at most every 5 seconds
+        USERS = JsonUserStore(USER_INFO_FILE, user_info, flush_interval=5.0)
+        if not os.path.isfile(USER_INFO_FILE):
+            USERS.touch()  # restored from a snapshot, write it out
+    USERS.start()
+    atexit.register(USERS.stop)
 
     token = open("token.config", "r").read().strip()
     target_channel_id = int(config_data["config"]["default_target_channel_id"]) or None
@@ -231,91 +364,98 @@ try:
     # ===== SERVER CONFIG =====
     ADMIN_ROLE_ID = int(config_data["config"].get("admin_role_id", 0)) or None
     BOTTEST_CHANNEL_ID = int(config_data["config"].get("bot_test_channel_id", 0)) or None
+    # Roles exempt from banned-word moderation, falls back to the admin role
+    IMMUNE_ROLE_IDS = {int(r) for r in config_data["config"].get("immune_role_ids", [])} or {ADMIN_ROLE_ID} - {None}
+    # OCR of image attachments, switched on per guild with !ocr
+    OCR_CONFIG = config_data.setdefault("ocr", {"default": False, "workers": 2, "max_pending": 16, "guilds": {}})
     
     # ===== INTERNAL USERINFO FUNCTIONS =====
     def get_userinfo(uid: int):
-        return user_info.get("discord_users", {}).get(str(uid))
+        return USERS.get(uid)
 
     def set_userinfo(uid: int, dispname: str, var1=None, var2=None, roles=None):
-        if "discord_users" not in user_info:
-            user_info["discord_users"] = {}
-
-        if str(uid) not in user_info["discord_users"]:
-            user_info["discord_users"][str(uid)] = {
-                "id": str(uid),
-                "dispname": dispname,
-                "var1": "N/A",
-                "var2": "N/A",
-                "roles": roles or ""
-            }
+        user_data = USERS.get(uid) or {
+            "id": str(uid),
+            "dispname": dispname,
+            "var1": "N/A",
+            "var2": "N/A",
+            "roles": roles or ""
+        }
 
         if var1 is not None:
-            user_info["discord_users"][str(uid)]["var1"] = var1
+            user_data["var1"] = var1
         if var2 is not None:
-            user_info["discord_users"][str(uid)]["var2"] = var2
+            user_data["var2"] = var2
         if roles is not None:
-            user_info["discord_users"][str(uid)]["roles"] = roles
+            user_data["roles"] = roles
 
-        save_json(USER_INFO_FILE, user_info)
-        return user_info["discord_users"][str(uid)]
+        return USERS.put(uid, user_data)
     
-    def update_user_var(uid_or_name, var1=None, var2=None):
-        if "discord_users" not in user_info:
-            user_info["discord_users"] = {}
-
-        # First try by ID
-        if str(uid_or_name) in user_info["discord_users"]:
-            user_data = user_info["discord_users"][str(uid_or_name)]
-        else:
-            # Try by display name
-            user_data = None
-            for u in user_info["discord_users"].values():
-                if u.get("dispname") == uid_or_name:
-                    user_data = u
-                    break
-
-        if not user_data:
-            return None
+    def find_users(uid_or_name):
+        """Users matching an ID, else a display name or username (case-insensitive)."""
+        user_data = USERS.get(uid_or_name)
+        if user_data:
+            return [user_data]
+        return USERS.find_name(uid_or_name)
 
+    def update_user_var(uid_or_name, var1=None, var2=None):
+        """Updated record, or None unless uid_or_name matches exactly one user."""
+        fields = {}
         if var1 is not None:
-            user_data["var1"] = var1
+            fields["var1"] = var1
         if var2 is not None:
-            user_data["var2"] = var2
+            fields["var2"] = var2
+
+        matches = find_users(uid_or_name)
+        if len(matches) != 1:
+            return None
+        return USERS.update(matches[0]["id"], fields)
 
-        save_json(USER_INFO_FILE, user_info)
-        return user_data
+    async def cached_members(guild):
+        # intents.members fills the cache at startup; only a guild that was not chunked needs it
+        if not guild.chunked:
+            await guild.chunk()
+        return [m for m in guild.members if not m.bot]
 
     @tasks.loop(hours=24)
-    async def auto_save_users():
+    async def auto_save_users(full=False):
         await bot.wait_until_ready()
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        if "discord_users" not in user_info:
-            user_info["discord_users"] = {}
-
-        for guild in bot.guilds:
-            async for member in guild.fetch_members(limit=None):  # Fetch all members
-                if member.bot:
-                    continue
+        # Guilds concurrently, from the gateway member cache (no REST paging)
+        members = {}
+        for guild_members in await asyncio.gather(*(cached_members(g) for g in bot.guilds)):
+            for member in guild_members:
+                members[member.id] = member
+
+        changed = []
+        for i, member in enumerate(members.values(), 1):
+            roles = [r.name for r in member.roles if r.name != "@everyone"]
+
+            # Keep existing var1/var2 if present
+            old_data = USERS.get(member.id) or {}
+            record = {
+                "id": str(member.id),
+                "dispname": member.display_name,
+                "username": str(member),  # full username with #1234
+                "joined_at": str(member.joined_at) if member.joined_at else "Unknown",
+                "created_at": str(member.created_at),
+                "roles": ", ".join(roles),
+                "var1": old_data.get("var1", "N/A"),
+                "var2": old_data.get("var2", "N/A")
+            }
+            if record != old_data:
+                changed.append(record)
+            if i % 1000 == 0:
+                await asyncio.sleep(0)  # let other events through on big guilds
 
-                roles = [r.name for r in member.roles if r.name != "@everyone"]
-
-                # Keep existing var1/var2 if present
-                old_data = user_info["discord_users"].get(str(member.id), {})
-                user_info["discord_users"][str(member.id)] = {
-                    "id": str(member.id),
-                    "dispname": member.display_name,
-                    "username": str(member),  # full username with #1234
-                    "joined_at": str(member.joined_at) if member.joined_at else "Unknown",
-                    "created_at": str(member.created_at),
-                    "roles": ", ".join(roles),
-                    "var1": old_data.get("var1", "N/A"),
-                    "var2": old_data.get("var2", "N/A")
-                }
+        if changed:
+            USERS.put_many(changed)
+        USERS.last_saved = now
+        await save_userinfo(session_id, full=full)
+        logging.info(f"Auto-saved {len(members)} users ({len(changed)} changed) at {now}")
 
-        user_info["last_saved"] = now
-        save_userinfo(user_info, session_id=session_id)
-        logging.info(f"Auto-saved {len(user_info.get('discord_users', {}))} users at {now}")
+    EDITVAR_MAX_CANDIDATES = 15
 
     # ===== FEEDBACK SETUP =====
     FEEDBACK_DIR = "feedback"
@@ -602,6 +742,7 @@ try:
             await bot.close()
         except Exception as e:
             logging.error(f"Error shutting down bot cleanly: {e}")
+        OCR.shutdown()
 
         bot_started = False
 
@@ -634,33 +775,6 @@ try:
     # def is_similar(a, b, threshold=0.9):
     #     return SequenceMatcher(None, a, b).ratio() >= threshold
     
-    hg = Homoglyphs()
-    def normalize_message(text: str) -> str:
-        text = str(text)
-        text = unidecode(text)
-        text = unicodedata.normalize("NFKC", text).lower()
-        text = re.sub(r'[\s\W_]+', '', text)
-        text = ''.join(c for c in text if not unicodedata.combining(c))
-        text = re.sub(r'[\u200B-\u200F\uFE00-\uFE0F\u2060-\u206F]', '', text)
-        text = ''.join(c for c in text if unicodedata.category(c)[0] != 'C')
-        text = re.sub(r'[\s\W_]+', '', text)
-        
-        replacements = str.maketrans({
-            '0': 'o',
-            '1': 'i',
-            '2': 'z',
-            '3': 'e',
-            '4': 'a',
-            '5': 's',
-            '6': 'g',
-            '7': 't',
-            '8': 'b',
-            '9': 'g'
-        })
-        text = text.translate(replacements)
-
-        return text
-
     async def replace_placeholders(ctx, text, self_id: int = 1260198579067420722):
         pattern = r"<\{(\w+):([^}]*)\}>"
         output = []
@@ -763,7 +877,7 @@ try:
             case _:
                 return banned
 
-    def save_banned_words(mode: str, data: set):
+    def save_banned_words(mode: str, data: set, guild_id: int = None):
         # load existing data if the file exists
         if os.path.exists(BANNED_WORDS_FILE):
             try:
@@ -778,11 +892,19 @@ try:
         current.setdefault("banned_words", [])
         current.setdefault("whitelisted_words", [])
 
+        # per-guild lists live under "guilds", seeded from the global default on first edit
+        target = current
+        if guild_id is not None:
+            target = current.setdefault("guilds", {}).setdefault(str(guild_id), {
+                "banned_words": list(current["banned_words"]),
+                "whitelisted_words": list(current["whitelisted_words"])
+            })
+
         # update the appropriate key
         if mode.lower() == "banned":
-            current["banned_words"] = sorted(list(data))
+            target["banned_words"] = sorted(list(data))
         elif mode.lower() == "whitelist":
-            current["whitelisted_words"] = sorted(list(data))
+            target["whitelisted_words"] = sorted(list(data))
         else:
             raise ValueError("mode must be 'banned' or 'whitelist'")
 
@@ -790,12 +912,204 @@ try:
         with open(BANNED_WORDS_FILE, "w", encoding="utf-8") as f:
             json.dump(current, f, ensure_ascii=False, indent=4)
 
-    BANNED_WORDS = load_banned_words("banned")
-    WHITELISTED_WORDS = load_banned_words("whitelist")
-    save_banned_words("banned", BANNED_WORDS)
-    save_banned_words("whitelist", WHITELISTED_WORDS)
+    save_banned_words("banned", load_banned_words("banned"))
+    save_banned_words("whitelist", load_banned_words("whitelist"))
+
+    # In-memory rulesets (global default + per guild), rebuilt on edits or when the file's mtime changes
+    BANNED_RULES = RulesetCache(BANNED_WORDS_FILE, normalize=normalize_word)
+    BANNED_RULES.reload()
+
+    # Members with an immune role (GOD role by default) skip moderation
+    IMMUNITY = ImmunityIndex(IMMUNE_ROLE_IDS)
+    # Fuzzy (edit-distance) matching costs several times the exact check, so it is opt-in
+    MODERATION_CONFIG = config_data.get("moderation", {})
+    MODERATION = ModerationEngine(BANNED_RULES, immunity=IMMUNITY, fuzzy=bool(MODERATION_CONFIG.get("fuzzy", False)))
+
+    # Normalized form of the last content checked per message, so edits that only change case,
+    # spacing or symbols are not re-moderated
+    EDIT_DIGESTS = ContentDigestCache(maxsize=4096)
+
+    # Image attachments are OCR'd in a process pool, the same image only once
+    OCR_MAX_PENDING = int(OCR_CONFIG.get("max_pending", 16))
+    OCR = AttachmentScanner(
+        workers=int(OCR_CONFIG.get("workers", 2)),
+        max_pending=OCR_MAX_PENDING,
+        guild_pending=max(1, OCR_MAX_PENDING // 2),
+    )
+
+    # Perceptual hashes of banned images (!banimage), near copies match too; global list + one per guild
+    BANNED_IMAGES_FILE = "banned_images.json"
+    IMAGE_BLOCKLIST = ImageBlocklist(BANNED_IMAGES_FILE)
+    IMAGE_BLOCKLIST.load()
+    MESSAGE_LINK_RE = re.compile(r"https?://(?:\w+\.)?discord(?:app)?\.com/channels/(\d+|@me)/(\d+)/(\d+)")
+
+    def ocr_enabled(guild_id) -> bool:
+        return bool(OCR_CONFIG.get("guilds", {}).get(str(guild_id), OCR_CONFIG.get("default", False)))
+
+    def set_ocr_enabled(guild_id, enabled: bool):
+        OCR_CONFIG.setdefault("guilds", {})[str(guild_id)] = enabled
+        save_json(CONFIG_FILE, config_data)
 
     PENDING_MOD = {}
+
+    # ===== EVENT LOG =====
+    # Optional JSON-lines record of messages, edits, moderation actions and commands (events/)
+    EVENTS = EventSink() if config_data.get("events", {}).get("enabled", False) else None
+    if EVENTS:
+        EVENTS.start()
+        atexit.register(EVENTS.stop)
+
+    def emit_event(kind: str, message=None, **fields):
+        """Record an event if the event log is on; message fills in guild/channel/user/message IDs."""
+        if EVENTS is None:
+            return
+        if message is not None:
+            fields.setdefault("g", message.guild.id if message.guild else None)
+            fields.setdefault("c", message.channel.id)
+            fields.setdefault("u", message.author.id)
+            fields.setdefault("m", message.id)
+        EVENTS.emit(kind, **fields)
+
+    # ===== MESSAGE ARCHIVE =====
+    # Optional SQLite (WAL + FTS5) copy of every message for !search, written in batches by a thread
+    ARCHIVE = MessageArchive() if config_data.get("archive", {}).get("enabled", False) else None
+    SEARCH_PAGE_SIZE = 10
+    if ARCHIVE:
+        ARCHIVE.start()
+        atexit.register(ARCHIVE.stop)
+
+    # ===== BACKGROUND TASKS =====
+    # The event loop only keeps weak references to tasks, fire-and-forget ones are held here until done
+    BACKGROUND_TASKS = set()
+
+    def _background_task_done(task):
+        BACKGROUND_TASKS.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Background task {task.get_name()} failed: {task.exception()!r}")
+
+    def spawn_task(coro, name: str = None) -> asyncio.Task:
+        """create_task for work nobody awaits: keeps the task alive and logs its exception."""
+        task = asyncio.create_task(coro, name=name)
+        BACKGROUND_TASKS.add(task)
+        task.add_done_callback(_background_task_done)
+        return task
+
+    # ===== ENFORCEMENT =====
+    TIMEOUT_DURATION = timedelta(minutes=5)
+
+    class EnforcementQueue:
+        """Per-channel queue for banned-word deletes, timeouts and notices.
+
+        The first violation in a quiet channel is handled right away. While a
+        batch is being applied, later violations pile up and go out together:
+        deletes through channel.delete_messages (up to 100 per call), timeouts
+        skipped for members already timed out, and one notice per batch.
+        """
+
+        def __init__(self, window: float = 1.0):
+            self.window = window
+            self._pending = {}   # channel_id -> {"channel", "messages", "members", "edited"}
+            self._workers = {}   # channel_id -> asyncio.Task
+            self._timed_out = {} # (guild_id, member_id) -> monotonic time the timeout ends
+
+        def submit(self, message, edited: bool = False, timeout: bool = True):
+            channel_id = message.channel.id
+            batch = self._pending.setdefault(channel_id, {
+                "channel": message.channel, "messages": [], "members": {}, "edited": edited
+            })
+            batch["messages"].append(message)
+            batch["edited"] = batch["edited"] and edited
+            if timeout:
+                batch["members"].setdefault(message.author.id, (message.author, message.content))
+
+            if channel_id not in self._workers:
+                self._workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+
+        def _already_timed_out(self, member) -> bool:
+            key = (member.guild.id, member.id)
+            until = self._timed_out.get(key)
+            if until is not None and until > time.monotonic():
+                return True
+            self._timed_out.pop(key, None)
+            return member.is_timed_out()
+
+        async def _drain(self, channel_id):
+            try:
+                while True:
+                    batch = self._pending.pop(channel_id, None)
+                    if not batch:
+                        return
+                    await self._apply(batch)
+                    # give a burst time to coalesce into the next batch
+                    await asyncio.sleep(self.window)
+            finally:
+                self._workers.pop(channel_id, None)
+
+        async def _delete(self, channel, messages):
+            if len(messages) == 1:
+                await messages[0].delete()
+                return
+            for i in range(0, len(messages), 100):
+                chunk = messages[i:i + 100]
+                try:
+                    await channel.delete_messages(chunk)
+                except discord.HTTPException as e:
+                    logging.warning(f"Bulk delete failed ({e}), deleting {len(chunk)} messages one by one.")
+                    for msg in chunk:
+                        try:
+                            await msg.delete()
+                        except discord.NotFound:
+                            pass
+
+        async def _apply(self, batch):
+            channel, edited = batch["channel"], batch["edited"]
+            tag = "[EDIT] " if edited else ""
+            try:
+                await self._delete(channel, batch["messages"])
+                for msg in batch["messages"]:
+                    emit_event("mod", msg, action="delete", edited=edited or None, content=msg.content)
+            except discord.NotFound:
+                pass
+            except Exception as e:
+                logging.error(f"{tag}Error deleting messages: {e}")
+
+            timed_out, forbidden = [], []
+            for member, content in batch["members"].values():
+                if not hasattr(member, "timeout"):
+                    continue  # not a guild member (DM)
+                if self._already_timed_out(member):
+                    logging.info(f"{tag}{member} already timed out, skipping.")
+                    continue
+                try:
+                    reason = "You tried to sneak in a banned word by editing, you dumb fuck." if edited else "You said a banned word."
+                    await member.timeout(TIMEOUT_DURATION, reason=reason)
+                    self._timed_out[(member.guild.id, member.id)] = time.monotonic() + TIMEOUT_DURATION.total_seconds()
+                    timed_out.append(member)
+                    logging.info(f"{tag}Timed out: {member} for '{content}'")
+                    emit_event("mod", g=member.guild.id, c=channel.id, u=member.id, action="timeout", reason=reason, content=content)
+                except discord.Forbidden:
+                    forbidden.append(member)
+                except Exception as e:
+                    logging.error(f"{tag}Error: {e}")
+
+            try:
+                if timed_out:
+                    mentions = ", ".join(m.mention for m in timed_out)
+                    verb = "has" if len(timed_out) == 1 else "have"
+                    if edited:
+                        await channel.send(f"{mentions} {verb} been timed out for editing in a fucking banned word.")
+                    else:
+                        await channel.send(f"{mentions} {verb} been timed out for using a banned word.")
+                if forbidden:
+                    mentions = ", ".join(m.mention for m in forbidden)
+                    if edited:
+                        await channel.send(f"I can't ban {mentions}, but they tried to be sneaky.")
+                        logging.error("[EDIT] Bot doesn't have permission to timeout this sneaky dumb fuck.")
+                    else:
+                        await channel.send(f"I can't timeout {mentions}, report admin abuse at 083-247-0928.")
+                        logging.error("Bot doesn't have permission to timeout this user.")
+            except Exception as e:
+                logging.error(f"{tag}Error sending timeout notice: {e}")
     
     # ===== BOT CREATION =====
     def create_bot():
@@ -807,12 +1121,80 @@ try:
         client = discord.Client(intents=intents)
         bot = commands.Bot(command_prefix=CMD_PREFIX, intents=intents, help_command=None)
         
+        # ===== MODERATION =====
+        def guild_id_of(ctx):
+            # word-list commands edit the invoking guild's list; DMs edit the global default
+            return ctx.guild.id if ctx.guild else None
+
+        enforcer = EnforcementQueue()
+        raid = RaidDetector()
+        deferred_logs = []
+
+        def flush_deferred_logs():
+            if deferred_logs:
+                logging.info(f"[RAID] {len(deferred_logs)} deferred message logs:\n" + "\n".join(deferred_logs))
+                deferred_logs.clear()
+
+        async def report_raid(channel, verdict=None):
+            target = bot.get_channel(target_channel_id)
+            if verdict is not None and verdict.raid:
+                text = f"⚠️ Raid mode ON in #{channel.name}: {verdict.reason}. Dropping duplicates, skipping fun responses."
+            else:
+                text = f"Raid mode OFF in #{getattr(channel, 'name', channel)}."
+            logging.warning(text)
+            if target:
+                try:
+                    await target.send(text)
+                except Exception as e:
+                    logging.error(f"Failed to send raid report: {e}")
+
+        @tasks.loop(seconds=5)
+        async def raid_watch():
+            ended = raid.expired()
+            for channel_id in ended:
+                await report_raid(bot.get_channel(channel_id) or channel_id)
+            if deferred_logs and (ended or len(deferred_logs) >= 500 or not raid.active_channels()):
+                flush_deferred_logs()
+
+        def punish_banned_word(message, edited: bool = False):
+            """Queue a message with a banned word for deletion and its author for a timeout."""
+            enforcer.submit(message, edited)
+
+        async def scan_attachments(message, ocr: bool = True):
+            """Check image attachments against the banned-image list, then OCR them for banned words."""
+            guild_id = message.guild.id if message.guild else None
+            for attachment in message.attachments:
+                digest, text = await OCR.scan(attachment, guild_id, ocr=ocr)
+                if digest is not None and IMAGE_BLOCKLIST.active(guild_id):
+                    hit = IMAGE_BLOCKLIST.match(digest, guild_id)
+                    if hit:
+                        logging.info(f"[IMAGE] Banned image {hit['hash']} (distance {hit['distance']}) in {attachment.filename} from {message.author} ({message.author.id})")
+                        punish_banned_word(message)
+                        return
+                if not text or not text.strip():
+                    continue
+                result = MODERATION.check(text, message.author)
+                if result.violation:
+                    logging.info(f"[OCR] Banned word {sorted(result.words)} in {attachment.filename} from {message.author} ({message.author.id})")
+                    punish_banned_word(message)
+                    return
+
         # ===== BOT EVENTS =====
         @bot.event
         async def on_ready():
             global startmessage
             logging.info(f"Logged in as {bot.user} (ID: {bot.user.id})")
 
+            if not raid_watch.is_running():
+                raid_watch.start()
+
+            for guild in bot.guilds:
+                IMMUNITY.rebuild_guild(guild)
+
+            OCR.start()
+            if not OCR.available:
+                logging.warning("Tesseract not found, image attachments will not be OCR'd.")
+
             if startmessage is None:
                 logging.info("No startmessage set.")
                 return
@@ -825,68 +1207,73 @@ try:
                 except Exception as e:
                     logging.error(f"Failed to send startup message: {e}")
 
+            # the first run of the loop happens right away
             if not auto_save_users.is_running():
                 auto_save_users.start()
-                
-            await auto_save_users()
 
         @bot.event
         async def on_message(message):
-            logging.info(
-                f"{message.id}:{message.author} ({message.author.id}) in #{message.channel.name} ({message.channel.id}): {message.content}"
+            log_line = f"{message.id}:{message.author} ({message.author.id}) in #{message.channel.name} ({message.channel.id}): {message.content}"
+            emit_event(
+                "message", message, a=str(message.author), content=message.content,
+                files=[a.filename for a in message.attachments] or None
             )
+            if ARCHIVE and message.content:
+                ARCHIVE.add(message)
 
             if message.author == bot.user:
+                if raid.in_raid(message.channel.id):
+                    deferred_logs.append(log_line)
+                else:
+                    logging.info(log_line)
                 return
 
+            # === Flood / raid detection ===
+            account_age = (discord.utils.utcnow() - message.author.created_at).total_seconds()
+            verdict = raid.observe(message.channel.id, message.author.id, message.content, account_age)
+            if verdict.changed:
+                spawn_task(report_raid(message.channel, verdict), name="report_raid")
+
+            if verdict.raid:
+                # cheap path: defer logging, drop copy-paste spam without further checks
+                deferred_logs.append(log_line)
+                if len(deferred_logs) >= 500:
+                    flush_deferred_logs()
+                if verdict.duplicates > 1 and not IMMUNITY.is_immune(message.author):
+                    enforcer.submit(message, timeout=False)
+                    return
+            else:
+                logging.info(log_line)
+
             ctx = await bot.get_context(message)
 
             if "commandIgnore" in message.content and await bot.is_owner(message.author):
                 return
 
-            # === Normalize ===
-            content = normalize_message(message.content)
-            content = re.sub(r'[^a-z0-9]', '', content)  # remove symbols inside words
-            content = re.sub(r'(.)\1{2,}', r'\1', content)  # collapse stretched letters
-
             # === Detection ===
-            banned = load_banned_words("banned")
-            whitelist = {normalize_message(w) for w in load_banned_words("whitelist")}
-
-            def is_banned(text: str) -> bool:
-                # check against all banned words but skip whitelisted ones
-                for word in banned:
-                    if word in text and not any(white in text for white in whitelist):
-                        return True
-                return False
+            result = MODERATION.check(message.content, message.author)
+            content = result.content
+            EDIT_DIGESTS.update(message.id, MODERATION.digest_key(message.content))
 
             if (
-                is_banned(content)
+                result.flagged
                 and not (ctx.command and ctx.command.name in ["banword", "rmword"])
             ):
-                # GOD role immunity
-                if any(role.id == 1411139316171931738 for role in message.author.roles):
-                    logging.info(f"User {message.author} has GOD role, not timeouted.")
+                if result.immune:
+                    logging.info(f"User {message.author} has an immune role, not timeouted.")
                     return
 
-                try:
-                    await message.delete()
-                    await message.author.timeout(
-                        timedelta(minutes=5),
-                        reason="You said a banned word."
-                    )
-                    await message.channel.send(
-                        f"{message.author.mention} has been timed out for using a banned word."
-                    )
-                    logging.info(f"Timed out: {message.author} for '{message.content}'")
-                except discord.Forbidden:
-                    await message.channel.send(
-                        f"I can't timeout {message.author.mention}, report admin abuse at 083-247-0928."
-                    )
-                    logging.error("Bot doesn't have permission to timeout this user.")
-                except Exception as e:
-                    logging.error(f"Error: {e}")
+                punish_banned_word(message)
+            elif message.attachments and not IMMUNITY.is_immune(message.author):
+                # raid banners still hit the blocklist, OCR waits until the raid is over
+                ocr = bool(message.guild) and ocr_enabled(message.guild.id) and not verdict.raid
+                if ocr or IMAGE_BLOCKLIST.active(message.guild.id if message.guild else None):
+                    spawn_task(scan_attachments(message, ocr), name="scan_attachments")
                     
+            if verdict.raid:
+                await bot.process_commands(message)
+                return
+
             if any(word in content.lower() for word in ["goodboy", "good boy"]) and bot.user.mentioned_in(message):
                 try:
                     await message.channel.send(f"☆*: .｡. o(≧▽≦)o .｡.:*☆, thanks papi {message.author.mention} 😩.")
@@ -911,28 +1298,54 @@ try:
             if after.author.bot:
                 return
 
-            ctx = await bot.get_context(after)
-            if ctx.valid:
+            # Embed unfurls and pins arrive as edits with the same text
+            if before.content == after.content:
                 return
+            emit_event("edit", after, a=str(after.author), content=after.content, before=before.content)
+            if ARCHIVE:
+                ARCHIVE.add(after, edited=True)
 
-            content = normalize_message(after.content)
-            if (
-                any(word in content for word in BANNED_WORDS)
-                and not (ctx.command and ctx.command.name in ["banword", "rmword"])
-                and not (after.author == bot.user)
-                and not any(role.id == 1411139316171931738 for role in after.author.roles)
-            ):
-                try:
-                    await after.delete()
-                    await after.author.timeout(timedelta(minutes=5), reason="You tried to sneak in a banned word by editing, you dumb fuck.")
-                    await after.channel.send(f"{after.author.mention} has been timed out for editing in a fucking banned word.")
-                    logging.info(f"[EDIT] Timed out: {after.author} for '{after.content}'")
-                except discord.Forbidden:
-                    await after.channel.send(f"I can't ban {after.author.mention}, but they tried to be sneaky.")
-                    logging.error("[EDIT] Bot doesn't have permission to timeout this sneaky dumb fuck.")
-                except Exception as e:
-                    logging.error(f"[EDIT] Error: {e}")
+            # case, spacing or symbol changes normalize to what was already checked
+            if not EDIT_DIGESTS.update(after.id, MODERATION.digest_key(after.content)):
+                return
+
+            # same exemption as on_message: only the word-list commands may contain banned words
+            if after.content.startswith(CMD_PREFIX):
+                ctx = await bot.get_context(after)
+                if ctx.valid and ctx.command.name in ["banword", "rmword"]:
+                    return
+
+            result = MODERATION.check(after.content, after.author)
+            if result.violation:
+                punish_banned_word(after, edited=True)
                     
+        @bot.event
+        async def on_command(ctx):
+            emit_event("command", ctx.message, name=ctx.command.qualified_name, content=ctx.message.content)
+
+        # ===== IMMUNITY INDEX UPKEEP =====
+        @bot.event
+        async def on_guild_join(guild):
+            IMMUNITY.rebuild_guild(guild)
+
+        @bot.event
+        async def on_guild_remove(guild):
+            IMMUNITY.remove_guild(guild.id)
+
+        @bot.event
+        async def on_member_update(before, after):
+            if before.roles != after.roles:
+                IMMUNITY.update_member(after)
+
+        @bot.event
+        async def on_member_remove(member):
+            IMMUNITY.remove_member(member)
+
+        @bot.event
+        async def on_guild_role_delete(role):
+            if role.id in IMMUNITY.role_ids:
+                IMMUNITY.rebuild_guild(role.guild)
+
         @bot.event
         async def on_member_join(member):
             channel = bot.get_channel(target_channel_id)
@@ -996,10 +1409,16 @@ try:
                     f"`{CMD_PREFIX}banword [word]` - Add banned word\n"
                     f"`{CMD_PREFIX}rmword [word]` - Remove banned word\n"
                     f"`{CMD_PREFIX}listbanword` - List banned words\n"
+                    f"`{CMD_PREFIX}ocr [on|off]` - Scan images for banned words\n"
+                    f"`{CMD_PREFIX}banimage [global] <message link>` - Ban a message's images\n"
+                    f"`{CMD_PREFIX}rmimage [global] <hash>` - Unban an image\n"
                     f"`{CMD_PREFIX}forgive @user` - Remove timeout\n"
                     f"`{CMD_PREFIX}pewthyself` - Shutdown bot (owner)\n"
                     f"`{CMD_PREFIX}deplete [ms|sec|min|hr|d] [value]` - Delayed shutdown\n"
                     f"`{CMD_PREFIX}seelog [date] [filename]` or `seelog recent` - View logs\n"
+                    f"`{CMD_PREFIX}greplog <pattern> [from] [to]` - Search logs\n"
+                    f"`{CMD_PREFIX}history @user [#channel] [days]` - User's recent events\n"
+                    f"`{CMD_PREFIX}search <words> [#channel] [@user] [page:N]` - Search messages\n"
                     f"`{CMD_PREFIX}cfch [channel_id|current]` - Change target channel"
                 ),
                 inline=False
@@ -1030,44 +1449,40 @@ try:
 
         @bot.command(name="saveuinf")
         @commands.has_permissions(administrator=True)
-        async def saveall(ctx):
-            """Trigger a manual save of user information (runs auto-save)."""
-            await auto_save_users()
+        async def saveall(ctx, mode: str = None):
+            """Trigger a manual save of user information (runs auto-save). Usage: !saveuinf [full]"""
+            await auto_save_users(full=(mode == "full"))
             await ctx.send("Manual save completed.")
 
         @bot.command(name="userinfo")
         async def userinfo_cmd(ctx, action: str = None, key: str = None, *, value: str = None):
             """View or edit stored user info. Usage: !userinfo view|edit|roles ..."""
             uid = str(ctx.author.id)
-            if uid not in user_info:
-                user_info[uid] = {
-                    "id": uid,
-                    "dispname": ctx.author.display_name,
-                    "var1": "",
-                    "var2": "",
-                    "roles": ""
-                }
+            info = USERS.get(uid) or USERS.put(uid, {
+                "id": uid,
+                "dispname": ctx.author.display_name,
+                "var1": "",
+                "var2": "",
+                "roles": ""
+            })
 
             if action == "view":
-                info = user_info[uid]
                 embed = discord.Embed(title=f"User Info: {ctx.author.display_name}", color=discord.Color.blue())
                 for k, v in info.items():
                     embed.add_field(name=k, value=v or "N/A", inline=False)
                 await ctx.send(embed=embed)
 
             elif action == "edit":
-                if key not in user_info[uid]:
+                if key not in info:
                     await ctx.send(f"Invalid key: `{key}`")
                     return
-                user_info[uid][key] = value
-                save_userinfo(user_info)
+                info = USERS.update(uid, {key: value})
                 await ctx.send(f"`{key}` updated to `{value}`")
 
             elif action == "roles":
                 roles = [r.name for r in ctx.author.roles if r.name != "@everyone"]
-                user_info[uid]["roles"] = ", ".join(roles)
-                save_userinfo(user_info)
-                await ctx.send(f"Roles updated: `{user_info[uid]['roles']}`")
+                info = USERS.update(uid, {"roles": ", ".join(roles)})
+                await ctx.send(f"Roles updated: `{info['roles']}`")
 
             else:
                 await ctx.send("Usage: `!userinfo view` | `!userinfo edit <key> <value>` | `!userinfo roles`")
@@ -1076,11 +1491,26 @@ try:
         @commands.has_permissions(administrator=True)
         async def editvar(ctx, identifier: str, var1: str = None, var2: str = None):
             """Edit a user's var1/var2 by ID or display name. Usage: !editvar <ID|dispname> <var1> <var2>"""
-            updated = update_user_var(identifier, var1, var2)
-            if not updated:
-                await ctx.send(f"User `{identifier}` not found in user info.")
+            matches = find_users(identifier)
+            if len(matches) != 1:
+                # Several users share the name, or none has it: list candidates to pick an ID from
+                candidates = matches or USERS.find_prefix(identifier, limit=EDITVAR_MAX_CANDIDATES)
+                if not candidates:
+                    await ctx.send(f"User `{identifier}` not found in user info.")
+                    return
+                header = (
+                    f"`{identifier}` matches {len(matches)} users, use an ID:" if matches
+                    else f"User `{identifier}` not found in user info. Did you mean:"
+                )
+                lines = [
+                    f"`{u['id']}` {u.get('dispname', '?')} ({u.get('username', 'N/A')})"
+                    for u in candidates[:EDITVAR_MAX_CANDIDATES]
+                ]
+                await ctx.send(header + "\n" + "\n".join(lines))
                 return
 
+            updated = update_user_var(matches[0]["id"], var1, var2)
+
             await ctx.send(
                 f"Updated user `{updated['dispname']}`:\nvar1 = `{updated.get('var1','N/A')}`\nvar2 = `{updated.get('var2','N/A')}`"
             )
@@ -1220,6 +1650,24 @@ try:
                 embed.add_field(
                     name="Disk Usage", value="\n".join(disk_info) or "Unavailable", inline=False
                 )
+                embed.add_field(
+                    name="Logging",
+                    value=(
+                        f"**Queued:** `{LOG_QUEUE.qsize()}/{LOG_QUEUE.maxsize}`\n"
+                        f"**Dropped (queue full):** `{queue_handler.dropped}`\n"
+                        f"**Dropped (console only):** `{console_handler.dropped}`"
+                    ),
+                    inline=False,
+                )
+                embed.add_field(
+                    name="User Store",
+                    value=(
+                        f"**Backend:** `{USER_BACKEND}`\n"
+                        f"**Users:** `{USERS.count()}`\n"
+                        f"**Writes this session:** `{USERS.writes}`"
+                    ),
+                    inline=False,
+                )
                 embed.add_field(name="GPU", value="\n".join(gpu_info), inline=False)
                 embed.add_field(
                     name="Network Interfaces",
@@ -1239,11 +1687,12 @@ try:
         async def ban_word(ctx, *, word: str):
             """Add a word to the banned-words list (admin only)."""
             word = word.lower().strip()
-            if word in BANNED_WORDS:
+            banned = BANNED_RULES.get(guild_id_of(ctx)).banned
+            if word in banned:
                 await ctx.send(f"'{word}' is already banned, dumbass.")
             else:
-                BANNED_WORDS.add(word)
-                save_banned_words("banned", BANNED_WORDS)
+                save_banned_words("banned", banned | {word}, guild_id_of(ctx))
+                BANNED_RULES.reload()
                 await ctx.send(f"Added '{word}' to the list of fucking banned words.")
                 logging.info(f"Added banned word: {word}")
 
@@ -1253,9 +1702,10 @@ try:
         async def remove_ban_word(ctx, *, word: str):
             """Remove a word from the banned list (admin only)."""
             word = word.lower().strip()
-            if word in BANNED_WORDS:
-                BANNED_WORDS.remove(word)
-                save_banned_words("banned", BANNED_WORDS)
+            banned = BANNED_RULES.get(guild_id_of(ctx)).banned
+            if word in banned:
+                save_banned_words("banned", banned - {word}, guild_id_of(ctx))
+                BANNED_RULES.reload()
                 await ctx.send(f"Removed '{word}' from the fucking list.")
                 logging.info(f"Removed banned word: {word}")
             else:
@@ -1265,18 +1715,123 @@ try:
         @commands.has_permissions(administrator=True)
         async def list_ban_words(ctx):
             """List all currently banned words (admin only)."""
-            if BANNED_WORDS:
-                await ctx.send("Here's the shit we're banning:\n" + ", ".join(sorted(BANNED_WORDS)))
+            banned = BANNED_RULES.get(guild_id_of(ctx)).banned
+            if banned:
+                await ctx.send("Here's the shit we're banning:\n" + ", ".join(sorted(banned)))
             else:
                 await ctx.send("No banned words, go wild.")
+
+        @bot.command(name="ocr")
+        @commands.has_permissions(administrator=True)
+        async def ocr_cmd(ctx, mode: str = None):
+            """Turn OCR of image attachments on/off for this server, or show its status (admin only)."""
+            if not ctx.guild:
+                await ctx.send("OCR is toggled per server, use this in one.")
+                return
+            if mode in ("on", "off"):
+                set_ocr_enabled(ctx.guild.id, mode == "on")
+                logging.info(f"[{ctx.author} ({ctx.author.id})] Turned OCR {mode} in {ctx.guild.name} ({ctx.guild.id})")
+            elif mode is not None:
+                await ctx.send(f"Usage: `{CMD_PREFIX}ocr [on|off]`")
+                return
+
+            state = "on" if ocr_enabled(ctx.guild.id) else "off"
+            if not OCR.available:
+                state += " (tesseract not found, nothing gets scanned)"
+            await ctx.send(
+                f"Image OCR is {state} for this server.\n"
+                f"OCR runs: {OCR.ocr_runs}, cache hits: {OCR.cache_hits}, "
+                f"in flight: {OCR.pending}/{OCR.max_pending}, dropped: {OCR.dropped}"
+            )
+
+        async def image_scope(ctx, args):
+            """(guild ID, or None for the global list, and the remaining argument) for !banimage/!rmimage.
+
+            The scope is False (after telling the user why) when the global list
+            is asked for by someone other than the owner, or nothing is outside a server.
+            """
+            if args and args[0].lower() == "global":
+                if not await bot.is_owner(ctx.author):
+                    await ctx.send("Only the bot owner can change the global banned images.")
+                    return False, None
+                return None, args[1] if len(args) > 1 else None
+            if ctx.guild is None:
+                await ctx.send("Outside a server, use `global` (owner only).")
+                return False, None
+            return ctx.guild.id, args[0] if args else None
+
+        @bot.command(name="banimage")
+        @commands.has_permissions(manage_messages=True)
+        async def ban_image(ctx, *args: str):
+            """Ban the images of a message (link, or reply to it) in this server, or everywhere with `global` (owner only)."""
+            scope, link = await image_scope(ctx, args)
+            if scope is False:
+                return
+            channel_id = message_id = None
+            if link:
+                match = MESSAGE_LINK_RE.search(link)
+                if match:
+                    channel_id, message_id = int(match.group(2)), int(match.group(3))
+            elif ctx.message.reference and ctx.message.reference.message_id:
+                channel_id, message_id = ctx.message.reference.channel_id, ctx.message.reference.message_id
+            if not message_id:
+                await ctx.send(f"Usage: `{CMD_PREFIX}banimage <message link>` or reply to the message with `{CMD_PREFIX}banimage`")
+                return
+
+            try:
+                channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+                target = await channel.fetch_message(message_id)
+            except (discord.NotFound, discord.Forbidden):
+                await ctx.send("Can't find that message.")
+                return
+
+            added, known = [], []
+            for attachment in target.attachments:
+                digest, _ = await OCR.scan(attachment, guild_id_of(ctx), ocr=False, limit=False)
+                if digest is None:
+                    continue
+                is_new, entry = IMAGE_BLOCKLIST.add(digest, scope, source=target.jump_url, added_by=str(ctx.author.id))
+                if is_new:
+                    added.append(entry["hash"])
+                else:
+                    # the hash that matched, so it can be passed to !rmimage
+                    known.append(f"`{entry['hash']}`" + (" (global)" if entry["guild_id"] is None and scope is not None else ""))
+
+            if not added and not known:
+                await ctx.send("No images in that message.")
+                return
+            where = "everywhere" if scope is None else "in this server"
+            if added:
+                logging.info(f"[{ctx.author} ({ctx.author.id})] Banned images {', '.join(added)} from {target.jump_url} {where}")
+                await ctx.send(f"Banned {len(added)} image(s) {where}: `{'`, `'.join(added)}`")
+            if known:
+                await ctx.send(f"Already banned: {', '.join(known)}")
+
+        @bot.command(name="rmimage")
+        @commands.has_permissions(manage_messages=True)
+        async def remove_banned_image(ctx, *args: str):
+            """Remove an image hash from this server's banned images, or the global list with `global` (owner only)."""
+            scope, image_hash = await image_scope(ctx, args)
+            if scope is False:
+                return
+            try:
+                value = int((image_hash or "").strip("`"), 16)
+            except ValueError:
+                await ctx.send("That's not an image hash, dumbass.")
+                return
+            if IMAGE_BLOCKLIST.remove(value, scope):
+                logging.info(f"[{ctx.author} ({ctx.author.id})] Removed banned image {value:016x} ({'global' if scope is None else scope})")
+                await ctx.send(f"Removed `{value:016x}` from the banned images.")
+            else:
+                await ctx.send(f"`{value:016x}` isn't even banned, idiot.")
                 
         @bot.command()
         @commands.is_owner()
         async def whitelistword(ctx, *, word: str):
             """Add a word to the whitelist (owner only)."""
             word = word.lower()
-            WHITELISTED_WORDS.add(word)
-            save_banned_words("whitelist", WHITELISTED_WORDS)
+            save_banned_words("whitelist", BANNED_RULES.get(guild_id_of(ctx)).whitelist | {word}, guild_id_of(ctx))
+            BANNED_RULES.reload()
             await ctx.send(f"Added `{word}` to the whitelist.")
 
 
@@ -1285,9 +1840,10 @@ try:
         async def rmwhitelistword(ctx, *, word: str):
             """Remove a word from the whitelist (owner only)."""
             word = word.lower()
-            if word in WHITELISTED_WORDS:
-                WHITELISTED_WORDS.remove(word)
-                save_banned_words("whitelist", WHITELISTED_WORDS)
+            whitelist = BANNED_RULES.get(guild_id_of(ctx)).whitelist
+            if word in whitelist:
+                save_banned_words("whitelist", whitelist - {word}, guild_id_of(ctx))
+                BANNED_RULES.reload()
                 await ctx.send(f"Removed `{word}` from the whitelist.")
             else:
                 await ctx.send(f"`{word}` is not in the whitelist.")
@@ -1297,8 +1853,9 @@ try:
         @commands.is_owner()
         async def listwhitelistword(ctx):
             """List all words in the whitelist (owner only)."""
-            if WHITELISTED_WORDS:
-                words = ", ".join(sorted(WHITELISTED_WORDS))
+            whitelist = BANNED_RULES.get(guild_id_of(ctx)).whitelist
+            if whitelist:
+                words = ", ".join(sorted(whitelist))
                 await ctx.send(f"Current whitelist: {words}")
             else:
                 await ctx.send("The whitelist is currently empty.")
@@ -1309,6 +1866,7 @@ try:
             """Remove a timeout from a member (requires moderate_members permission)."""
             try:
                 await member.edit(timed_out_until=None)
+                emit_event("mod", g=ctx.guild.id, c=ctx.channel.id, u=member.id, action="forgive", by=ctx.author.id)
                 await ctx.send(f"{member.mention} has been forgiven and their timeout has been lifted, don't say that again dumb fuck.")
             except discord.Forbidden:
                 await ctx.send("Shit, I don't have permission to forgive this user.")
@@ -1385,6 +1943,22 @@ try:
                 except ValueError:
                     await ctx.send("Please provide a valid channel ID or use current.")
 
+        async def send_log_file(ctx, text: str, path: str):
+            """Attach a log segment, gzipped first when it is large."""
+            filename = os.path.basename(path)
+            if path.endswith(".gz") or os.path.getsize(path) <= LOG_UPLOAD_GZIP_BYTES:
+                data = None
+                size = os.path.getsize(path)
+            else:
+                data = await asyncio.to_thread(gzip_bytes, path)
+                size = len(data)
+            if size > LOG_UPLOAD_MAX_BYTES:
+                await ctx.send(f"{filename} is too big to upload even gzipped, use `{CMD_PREFIX}greplog`.")
+            elif data is None:
+                await ctx.send(text, file=discord.File(path, filename=filename))
+            else:
+                await ctx.send(text, file=discord.File(io.BytesIO(data), filename=filename + ".gz"))
+
         @bot.command(name="seelog")
         @commands.has_permissions(administrator=True)
         async def see_log(ctx, date: str = None, filename: str = None):
@@ -1393,40 +1967,156 @@ try:
             logging.info(f"[{ctx.author} ({ctx.author.id})] Called see_log with date: {date}, filename: {filename}")
 
             if date == "recent":
-                log_dirs = sorted(os.listdir("log"), reverse=True)
-                if not log_dirs:
+                latest = LOG_INDEX.latest()
+                if not latest:
                     await ctx.send("No logs found.")
                     return
-                recent_dir = log_dirs[0]
-                log_files = sorted(os.listdir(f"log/{recent_dir}"), reverse=True)
-                if not log_files:
-                    await ctx.send("No log files found in the most recent directory.")
-                    return
-                date, filename = recent_dir, log_files[0]
+                date, filename = latest
 
             if not date or not filename:
                 await ctx.send("Please provide a valid date and filename, or use 'recent'.")
                 return
 
-            path = f"log/{date}/{filename}"
-            if os.path.exists(path):
+            # rotated segments are gzipped, so log_x.txt may now be log_x.txt.gz
+            path = resolve_log(f"{LOG_ROOT}/{date}/{filename}")
+            if path:
                 try:
-                    with open(path, "r", encoding="utf-8", errors="replace") as f:
-                        content = f.read()
-
-                    if len(content) < 1900:
-                        await ctx.send(f"```\n{content}\n```")
-                    else:
-                        # Send just the last 1900 chars for readability
-                        await ctx.send(f"```{content[-1900:]}```")
+                    # only the tail is read, seeking back from the end of the file
+                    content = await asyncio.to_thread(tail_log, path, 1900)
+                    await ctx.send(f"```\n{content}\n```")
+                    if path.endswith(".gz") or os.path.getsize(path) > len(content.encode("utf-8")):
                         # Or send full log file as attachment
-                        await ctx.send("Full log attached:", file=discord.File(path))
+                        await send_log_file(ctx, "Full log attached:", path)
 
                 except Exception as e:
                     await ctx.send(f"Error reading log file: {e}")
             else:
                 await ctx.send("Log not found. I lost it or u dyslexic?")
 
+        @bot.command(name="greplog")
+        @commands.has_permissions(administrator=True)
+        async def grep_log(ctx, pattern: str, start: str = None, end: str = None):
+            """Search the logs with a case-insensitive regex, optionally by date (admin only).
+            Usage: !greplog <pattern> [YYYY-MM-DD] [YYYY-MM-DD] (quote patterns with spaces)"""
+            logging.info(f"[{ctx.author} ({ctx.author.id})] Called greplog with pattern: {pattern}, start: {start}, end: {end}")
+
+            if start and ".." in start and not end:
+                start, end = start.split("..", 1)
+            for day in (start, end):
+                if day:
+                    try:
+                        datetime.strptime(day, "%Y-%m-%d")
+                    except ValueError:
+                        await ctx.send(f"Usage: `{CMD_PREFIX}greplog <pattern> [YYYY-MM-DD] [YYYY-MM-DD]`")
+                        return
+            if start and not end:
+                end = start
+            try:
+                regex = compile_grep_pattern(pattern)
+            except re.error as e:
+                await ctx.send(f"Invalid pattern: {e}")
+                return
+
+            paths = LOG_INDEX.paths(start, end)
+            hits = await asyncio.to_thread(lambda: list(grep_logs(paths, regex, GREPLOG_LIMIT)))
+            if not hits:
+                await ctx.send("No matches.")
+                return
+
+            lines = [f"{os.path.basename(os.path.dirname(path))}/{os.path.basename(path)}: {line}" for path, line in hits]
+            header = f"{len(hits)} match(es)" + (f", stopped at {GREPLOG_LIMIT}" if len(hits) >= GREPLOG_LIMIT else "")
+            text = "\n".join(lines)
+            if len(text) <= 1900:
+                await ctx.send(f"{header}:\n```\n{text}\n```")
+            else:
+                data = text.encode("utf-8")
+                filename = "greplog.txt"
+                if len(data) > LOG_UPLOAD_GZIP_BYTES:
+                    data, filename = gzip.compress(data), filename + ".gz"
+                await ctx.send(f"{header}, attached:", file=discord.File(io.BytesIO(data), filename=filename))
+
+        @bot.command(name="history")
+        @commands.has_permissions(administrator=True)
+        async def history(ctx, user: discord.User, channel: typing.Optional[discord.TextChannel] = None, days: int = 7):
+            """Show what a user said/did recently, from the event log (admin only).
+            Usage: !history @user [#channel] [days]"""
+            logging.info(f"[{ctx.author} ({ctx.author.id})] Called history for {user} ({user.id}), channel: {channel}, days: {days}")
+            if EVENTS is None:
+                await ctx.send("The event log is off, turn on `events.enabled` in config.json.")
+                return
+
+            days = max(1, min(days, 90))
+            records = await asyncio.to_thread(
+                EVENTS.query, user.id, channel.id if channel else None, days, None, 30
+            )
+            if not records:
+                await ctx.send(f"Nothing from {user} in the last {days} day(s).")
+                return
+
+            lines = []
+            for record in reversed(records):
+                stamp = datetime.fromtimestamp(record["t"]).strftime("%Y-%m-%d %H:%M")
+                where = bot.get_channel(record.get("c"))
+                where = f"#{where.name}" if where else str(record.get("c", "?"))
+                kind = record["k"] if record["k"] != "mod" else f"mod:{record.get('action')}"
+                lines.append(f"{stamp} {where} [{kind}] {record.get('content', '')}"[:200])
+
+            text = "\n".join(lines)
+            while len(text) > 1900:
+                lines.pop(0)
+                text = "\n".join(lines)
+            await ctx.send(f"Last {len(lines)} event(s) for {user}:\n```\n{text}\n```")
+
+        @bot.command(name="search")
+        @commands.has_permissions(administrator=True)
+        async def search(ctx, *, query: str):
+            """Full-text search of archived messages in this server (admin only).
+            Usage: !search <words> [#channel] [@user] [page:N]"""
+            logging.info(f"[{ctx.author} ({ctx.author.id})] Called search with: {query}")
+            if ARCHIVE is None:
+                await ctx.send("The message archive is off, turn on `archive.enabled` in config.json.")
+                return
+
+            channel = ctx.message.channel_mentions[0] if ctx.message.channel_mentions else None
+            user = ctx.message.mentions[0] if ctx.message.mentions else None
+            page = 1
+            words = []
+            for token in query.split():
+                if re.fullmatch(r"<[#@][!&]?\d+>", token):
+                    continue  # the mentions above
+                if re.fullmatch(r"page:\d+", token.lower()):
+                    page = max(1, int(token.split(":", 1)[1]))
+                    continue
+                words.append(token)
+
+            try:
+                total, rows = await asyncio.to_thread(
+                    ARCHIVE.search, " ".join(words), ctx.guild.id if ctx.guild else None,
+                    channel.id if channel else None, user.id if user else None, page, SEARCH_PAGE_SIZE
+                )
+            except ValueError as e:
+                await ctx.send(f"Can't search that: {e}.")
+                return
+            if not rows:
+                await ctx.send("No matches." if total == 0 else f"Only {total} match(es), there's no page {page}.")
+                return
+
+            pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+            lines = []
+            for message_id, guild_id, channel_id, author, created, content in rows:
+                stamp = datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M")
+                link = f"https://discord.com/channels/{guild_id or '@me'}/{channel_id}/{message_id}"
+                snippet = content if len(content) <= 200 else content[:197] + "..."
+                lines.append(f"[{stamp}]({link}) **{discord.utils.escape_markdown(author)}**: {discord.utils.escape_markdown(snippet)}")
+
+            embed = discord.Embed(title=f"Search: {' '.join(words)}"[:256], description="\n".join(lines)[:4096], color=discord.Color.blurple())
+            footer = f"Page {page}/{pages}, {total} match(es)"
+            if page < pages:
+                next_query = " ".join(t for t in query.split() if not t.lower().startswith("page:"))
+                footer += f" - {CMD_PREFIX}search {next_query} page:{page + 1} for more"
+            embed.set_footer(text=footer[:2048])
+            await ctx.send(embed=embed)
+
         @bot.command(name="thx")
         async def thank_you(ctx):
             """Reply with 'np' when thanked."""
@@ -1978,6 +2668,7 @@ try:
                         logging.error(f"Error shutting down: {e}")
 
                     bot_started = False
+                    USERS.flush()
                     logging.info("Bot stopped.")
 
                 elif command == "exit":
@@ -1994,15 +2685,18 @@ try:
                                 except Exception as e:
                                     logging.error(f"Error shutting down bot: {e}")
                                 finally:
+                                    USERS.flush()
                                     sys.exit(0)
                             elif decision == "f":
                                 print("Committing suicide...")
+                                USERS.flush()
                                 sys.exit(0)
                             elif decision == "n":
                                 break
                             else:
                                 logging.info("Pick something.")
                     else:
+                        USERS.flush()
                         sys.exit(0)
 
                 elif command == "targch" and args and args[0].isdigit():
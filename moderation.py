@@ -0,0 +1,811 @@
+'''
+Banned-word matching for BestBotEver!!!
+Kept free of Discord/console side effects so it can be imported on its own.
+'''
+
+from collections import OrderedDict, deque
+from functools import lru_cache
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+
+from unidecode import unidecode
+
+
+# ===== NORMALIZATION =====
+# Leetspeak digits folded into the letters they usually stand in for
+DIGIT_LETTERS = {
+    '0': 'o',
+    '1': 'i',
+    '2': 'z',
+    '3': 'e',
+    '4': 'a',
+    '5': 's',
+    '6': 'g',
+    '7': 't',
+    '8': 'b',
+    '9': 'g'
+}
+
+
+def _build_ascii_fold_table():
+    # One translate() pass: lowercase letters, fold digits, drop everything else
+    table = {}
+    for code in range(128):
+        char = chr(code)
+        if 'a' <= char <= 'z':
+            continue
+        elif 'A' <= char <= 'Z':
+            table[code] = char.lower()
+        elif char in DIGIT_LETTERS:
+            table[code] = DIGIT_LETTERS[char]
+        else:
+            table[code] = None
+    return table
+
+
+ASCII_FOLD_TABLE = _build_ascii_fold_table()
+
+# ===== CONFUSABLES =====
+# Lookalike characters folded to the ASCII letter they imitate (Cyrillic "р" -> "p",
+# not the "r" transliteration gives). Built once from the homoglyphs data and
+# cached on disk, so later startups only read a small JSON file.
+CONFUSABLES_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "confusables.json")
+CONFUSABLES_VERSION = 1
+# fullwidth forms, mathematical alphanumerics, letterlike/enclosed/super- and subscript forms
+NFKC_RANGES = [
+    (0x2070, 0x209F),
+    (0x2100, 0x214F),
+    (0x2460, 0x24FF),
+    (0xFF00, 0xFFEF),
+    (0x1D400, 0x1D7FF),
+    (0x1F130, 0x1F189),
+]
+
+
+def _fold_candidate(char: str):
+    if len(char) == 1 and char.isascii() and char.isalnum():
+        return char.lower()
+    return None
+
+
+def build_confusables_table() -> dict:
+    """Flat {code point: ascii char} table for str.translate()."""
+    table = {}
+    for start, end in NFKC_RANGES:
+        for code in range(start, end + 1):
+            folded = _fold_candidate(unicodedata.normalize("NFKC", chr(code)))
+            if folded:
+                table[code] = folded
+
+    import homoglyphs  # only needed when the cache is missing or stale
+    path = os.path.join(os.path.dirname(homoglyphs.__file__), "confusables.json")
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    candidates = {}
+    for key, glyphs in data.items():
+        target = _fold_candidate(key)
+        for glyph in glyphs:
+            if target and len(glyph) == 1 and not glyph.isascii():
+                candidates.setdefault(ord(glyph), set()).add(target)
+            elif len(key) == 1 and not key.isascii() and _fold_candidate(glyph):
+                candidates.setdefault(ord(key), set()).add(_fold_candidate(glyph))
+
+    for code, targets in candidates.items():
+        if code not in table:
+            # letters win over digits, then alphabetical, so the table is deterministic
+            table[code] = min(targets, key=lambda c: (c.isdigit(), c))
+    return table
+
+
+def load_confusables_table(cache_path: str = CONFUSABLES_CACHE) -> dict:
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("version") == CONFUSABLES_VERSION:
+            return {int(code): char for code, char in cached["table"].items()}
+    except (OSError, ValueError, KeyError):
+        pass
+
+    table = build_confusables_table()
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CONFUSABLES_VERSION, "table": table}, f)
+    except OSError as e:
+        logging.warning(f"Could not cache confusables table: {e}")
+    return table
+
+
+CONFUSABLES_TABLE = load_confusables_table()
+STRETCH_RE = re.compile(r'(.)\1{2,}')
+NORMALIZE_CACHE_SIZE = 4096
+
+# ===== THAI =====
+# Thai is matched natively instead of through unidecode; the Latin path drops it
+THAI_CHAR_RE = re.compile(r'[\u0E01-\u0E5B]')
+# maitaikhu, tone marks, thanthakhat, yamakkan; nikhahit (U+0E4D) stays until sara am is composed
+THAI_MARKS = {code: None for code in range(0x0E47, 0x0E4F) if code != 0x0E4D}
+DECOMPOSED_SARA_AM = "\u0E4D\u0E32"  # nikhahit + sara aa, typed for sara am (U+0E33)
+ZERO_WIDTH = {code: None for code in (0x200B, 0x200C, 0x200D, 0x2060, 0xFEFF)}
+THAI_FOLD_TABLE = {**THAI_MARKS, **ZERO_WIDTH}
+NON_THAI_RE = re.compile(r'[^\u0E01-\u0E46]+')  # keeps consonants and vowels only
+THAI_VOWEL_PADDING_RE = re.compile(r'([\u0E31\u0E34-\u0E3A])\1+')
+LATIN_FOLD_TABLE = {**CONFUSABLES_TABLE, **{code: None for code in range(0x0E01, 0x0E5C)}}
+
+
+def has_thai(text: str) -> bool:
+    return THAI_CHAR_RE.search(text) is not None
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_thai(text: str) -> str:
+    """Thai letters only: tone marks, zero-width joiners, repeated vowel signs,
+    stretched letters and everything non-Thai removed, decomposed sara am composed."""
+    text = str(text).translate(THAI_FOLD_TABLE)
+    if DECOMPOSED_SARA_AM in text:
+        text = text.replace(DECOMPOSED_SARA_AM, "\u0E33")
+    text = NON_THAI_RE.sub('', text)
+    if len(text) > 1:
+        text = THAI_VOWEL_PADDING_RE.sub(r'\1', text)
+        text = STRETCH_RE.sub(r'\1', text)
+    return text
+
+
+def normalize_message(text: str) -> str:
+    """Fold text to lowercase ASCII letters with leetspeak digits mapped.
+
+    Non-ASCII text first has lookalike characters folded (and Thai, which
+    normalize_thai handles, dropped) in one translate() pass; whatever is
+    still non-ASCII goes through unidecode. unidecode always returns ASCII,
+    so the old NFKC / combining-mark / zero-width / control-char passes had
+    nothing left to remove; a final translate() does the rest.
+    """
+    text = str(text)
+    if not text.isascii():
+        text = text.translate(LATIN_FOLD_TABLE)
+        if not text.isascii():
+            text = unidecode(text)
+    return text.translate(ASCII_FOLD_TABLE)
+
+
+def normalize_word(text: str) -> str:
+    """normalize_message plus stretched-letter collapsing, uncached (word lists, single tokens)."""
+    text = normalize_message(text)
+    if len(text) > 2:
+        text = STRETCH_RE.sub(r'\1', text)
+    return text
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_for_matching(text: str) -> str:
+    """normalize_word memoized for whole messages, so repeated spam is folded once."""
+    return normalize_word(text)
+
+
+# ===== MATCHER =====
+BANNED = 0
+WHITELIST = 1
+
+
+class BannedWordMatcher:
+    """Aho-Corasick automaton over the banned and whitelisted words.
+
+    Built once per word list; a single pass over the text reports every
+    banned and whitelisted occurrence.
+    """
+
+    def __init__(self, banned_words=(), whitelisted_words=()):
+        # node 0 is the root; each node has a goto dict, a fail link and outputs
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for word in banned_words:
+            self._add(word, BANNED)
+        for word in whitelisted_words:
+            self._add(word, WHITELIST)
+        self._build()
+
+        self.banned_words = frozenset(w for w in banned_words if w)
+        self.whitelisted_words = frozenset(w for w in whitelisted_words if w)
+
+    def _add(self, word: str, kind: int):
+        if not word:
+            return
+        node = 0
+        for char in word:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] = self._out[node] + ((word, kind),)
+
+    def _build(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        # depth-1 nodes keep fail = root; everything deeper is filled breadth-first
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                f = fail[node]
+                while f and char not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(char, 0)
+                out[child] = out[child] + out[fail[child]]
+
+    def iter_matches(self, text: str):
+        """Yield (end_index, word, kind) for every occurrence in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                for word, kind in out[node]:
+                    yield i, word, kind
+
+    def scan(self, text: str):
+        """(banned words found, whitelisted) for text.
+
+        Same rule the old per-word loop applied: any whitelisted word in the
+        message exempts it, so the hit list is empty when whitelisted is True.
+        """
+        hits = []
+        for _, word, kind in self.iter_matches(text):
+            if kind == WHITELIST:
+                return [], True
+            hits.append(word)
+        return hits, False
+
+
+# ===== FUZZY MATCHING =====
+FUZZY_MIN_LENGTH = 7  # words this long tolerate one edit unless configured otherwise
+FUZZY_MAX_TOLERANCE = 2  # cap for configured tolerances; variants grow as len(token) ** k
+
+
+def default_fuzzy_tolerance(word: str) -> int:
+    return 1 if len(word) >= FUZZY_MIN_LENGTH else 0
+
+
+def bounded_levenshtein(a: str, b: str, limit: int) -> int:
+    """Edit distance between a and b, or limit + 1 as soon as it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            cost = previous[j - 1] + (ca != cb)
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current.append(cost)
+            if cost < row_min:
+                row_min = cost
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def _deletions(word: str, depth: int) -> set:
+    """word plus every string reachable from it by deleting up to depth characters."""
+    variants = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+class FuzzyIndex:
+    """Symmetric-delete index for "banned words within edit distance k" lookups.
+
+    If two words are within edit distance k, deleting at most k characters
+    from each reaches a common string. Every banned word is indexed under
+    its deletion variants (up to its own tolerance), so a query only
+    generates the token's variants, looks them up, and verifies the few
+    candidates with a bounded edit distance. Cost depends on token length
+    and k, not on how many words are banned; tokens too long or too short
+    to be within k of any banned word are rejected before any variant is made.
+    """
+
+    def __init__(self, tolerances: dict = None):
+        self.tolerances = {}
+        self.max_tolerance = 0
+        self.min_length = None
+        self.max_length = 0
+        self._variants = {}  # deletion variant -> set of banned words
+        for word, tolerance in (tolerances or {}).items():
+            self.add(word, tolerance)
+
+    def __len__(self):
+        return len(self.tolerances)
+
+    def add(self, word: str, tolerance: int):
+        tolerance = min(tolerance, FUZZY_MAX_TOLERANCE)
+        if not word or tolerance <= 0 or word in self.tolerances:
+            return
+        self.tolerances[word] = tolerance
+        self.max_tolerance = max(self.max_tolerance, tolerance)
+        self.max_length = max(self.max_length, len(word))
+        self.min_length = len(word) if self.min_length is None else min(self.min_length, len(word))
+        for variant in _deletions(word, tolerance):
+            self._variants.setdefault(variant, set()).add(word)
+
+    def may_match(self, term: str, normalized: bool = True) -> bool:
+        """False if term's length alone rules out every banned word.
+
+        For a term not normalized yet only ASCII terms that are too short are
+        ruled out: folding ASCII only drops or collapses characters, while
+        unidecode can lengthen other scripts.
+        """
+        if not self.tolerances:
+            return False
+        if not normalized:
+            return not term.isascii() or len(term) >= self.min_length - self.max_tolerance
+        return self.min_length - self.max_tolerance <= len(term) <= self.max_length + self.max_tolerance
+
+    def search(self, term: str) -> list:
+        """(word, distance) for every word within that word's own tolerance of term."""
+        if not self.may_match(term):
+            return []
+        candidates = set()
+        variants = self._variants
+        for variant in _deletions(term, self.max_tolerance):
+            words = variants.get(variant)
+            if words:
+                candidates |= words
+
+        found = []
+        for word in candidates:
+            k = self.tolerances[word]
+            d = bounded_levenshtein(term, word, k)
+            if d <= k:
+                found.append((word, d))
+        return found
+
+# ===== RULESET =====
+class BannedWordRuleset:
+    """Immutable snapshot of the banned/whitelisted words plus their compiled matcher."""
+
+    def __init__(self, banned_words=(), whitelisted_words=(), normalize=None, fuzzy_tolerance=None):
+        self.banned = frozenset(banned_words)
+        self.whitelist = frozenset(whitelisted_words)
+        self.normalize = normalize
+        if normalize is not None:
+            self.normalized_whitelist = frozenset(normalize(w) for w in self.whitelist)
+        else:
+            self.normalized_whitelist = self.whitelist
+        # banned words are folded like message text (pass normalize_word), so "n1gga", "fück" or "fuuuck" can match at all
+        latin_banned = [w for w in self.banned if not has_thai(w)]
+        if normalize is not None:
+            latin_banned = [normalize(w) for w in latin_banned]
+        self.matcher = BannedWordMatcher(latin_banned, self.normalized_whitelist)
+
+        # Thai words get their own automaton over natively normalized text
+        thai_banned = [normalize_thai(w) for w in self.banned if has_thai(w)]
+        thai_whitelist = [normalize_thai(w) for w in self.whitelist if has_thai(w)]
+        self.thai_matcher = BannedWordMatcher(thai_banned, thai_whitelist) if thai_banned else None
+
+        # per-word edit-distance tolerance; 0 means exact matching only
+        self.fuzzy_tolerance = dict(fuzzy_tolerance or {})
+        tolerances = {}
+        for word in self.banned:
+            if has_thai(word):
+                continue
+            key = normalize(word) if normalize is not None else word
+            tolerances[key] = int(self.fuzzy_tolerance.get(word, default_fuzzy_tolerance(key)))
+        self.fuzzy = FuzzyIndex(tolerances)
+        self._fuzzy_cache = {}
+
+    def scan(self, text: str):
+        return self.matcher.scan(text)
+
+    def scan_thai(self, text: str):
+        """Like scan(), for text already passed through normalize_thai()."""
+        if self.thai_matcher is None or not text:
+            return [], False
+        return self.thai_matcher.scan(text)
+
+    def fuzzy_hits(self, tokens) -> list:
+        """Banned words within tolerance of any raw token.
+
+        Tokens are length-checked before and after being normalized (with the
+        word-list function, not the per-message cache) and only then looked up.
+        """
+        fuzzy = self.fuzzy
+        if not len(fuzzy):
+            return []
+        cache = self._fuzzy_cache
+        hits = []
+        for token in tokens:
+            if not fuzzy.may_match(token, normalized=False):
+                continue
+            if self.normalize is not None:
+                token = self.normalize(token)
+            if token in self.normalized_whitelist or not fuzzy.may_match(token):
+                continue
+            found = cache.get(token)
+            if found is None:
+                found = [word for word, _ in self.fuzzy.search(token)]
+                if len(cache) >= 4096:
+                    cache.clear()
+                cache[token] = found
+            hits.extend(found)
+        return hits
+
+
+class RulesetCache:
+    """Keeps the compiled rulesets for a banned-words file in memory.
+
+    The top-level "banned_words"/"whitelisted_words" are the global default;
+    a guild listed under "guilds" gets its own ruleset instead. The file is
+    only re-parsed when reload() is called or its mtime changes (checked at
+    most once every check_interval seconds). Rulesets are immutable and the
+    guild map is replaced in one assignment, so a check that already holds a
+    ruleset never sees a half-built matcher.
+    """
+
+    def __init__(self, path: str, normalize=None, check_interval: float = 1.0):
+        self.path = path
+        self.normalize = normalize
+        self.check_interval = check_interval
+        self._default = None
+        self._guilds = {}  # guild_id -> BannedWordRuleset
+        self._mtime = None
+        self._next_check = 0.0
+
+    def _stat_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _compile(self, section: dict, previous) -> BannedWordRuleset:
+        banned = frozenset(section.get("banned_words", []))
+        whitelist = frozenset(section.get("whitelisted_words", []))
+        tolerance = section.get("fuzzy_tolerance", {})
+        # unchanged lists keep their already-compiled matcher
+        if (
+            previous is not None
+            and previous.banned == banned
+            and previous.whitelist == whitelist
+            and previous.fuzzy_tolerance == tolerance
+        ):
+            return previous
+        return BannedWordRuleset(banned, whitelist, self.normalize, tolerance)
+
+    def reload(self) -> BannedWordRuleset:
+        mtime = self._stat_mtime()
+        data = {}
+        if mtime is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                logging.info(f"Error loading banned words file: {e}")
+                if self._default is not None:
+                    # keep serving the last good rulesets; the bad file is not re-read until it changes
+                    self._mtime = mtime
+                    return self._default
+
+        default = self._compile(data, self._default)
+        guilds = {}
+        for gid, section in data.get("guilds", {}).items():
+            gid = int(gid)
+            guilds[gid] = self._compile(section, self._guilds.get(gid))
+
+        self._default, self._guilds = default, guilds
+        self._mtime = mtime
+        self._next_check = time.monotonic() + self.check_interval
+        return default
+
+    def _refresh(self):
+        if self._default is None:
+            self.reload()
+            return
+
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            if self._stat_mtime() != self._mtime:
+                self.reload()
+
+    def get(self, guild_id: int = None) -> BannedWordRuleset:
+        """Ruleset for guild_id, or the global default if the guild has none."""
+        self._refresh()
+        if guild_id is not None:
+            ruleset = self._guilds.get(guild_id)
+            if ruleset is not None:
+                return ruleset
+        return self._default
+
+# ===== EDIT DEDUP =====
+class ContentDigestCache:
+    """Bounded message ID -> digest of the last content checked.
+
+    Lets the edit handler skip moderation when an edit only changes what
+    the check ignores (case, spacing, symbols): store ModerationEngine.digest_key()
+    of the text, not the text itself. Oldest IDs are evicted first.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._digests = OrderedDict()
+
+    def __len__(self):
+        return len(self._digests)
+
+    def update(self, key, value) -> bool:
+        """Store the digest of value for key; True if it is new or differs from the stored one."""
+        digest = hash(value)
+        previous = self._digests.get(key)
+        if previous is not None:
+            self._digests.move_to_end(key)
+            if previous == digest:
+                return False
+        self._digests[key] = digest
+        if len(self._digests) > self.maxsize:
+            self._digests.popitem(last=False)
+        return True
+
+
+# ===== IMMUNITY =====
+class ImmunityIndex:
+    """Per-guild set of member IDs exempt from moderation.
+
+    Built from members holding any of the configured role IDs and kept
+    current from member/role events, so the check itself is one set lookup.
+    """
+
+    def __init__(self, role_ids=()):
+        self.role_ids = frozenset(role_ids)
+        self._members = {}  # guild_id -> set of member IDs
+
+    def has_immune_role(self, member) -> bool:
+        return any(role.id in self.role_ids for role in getattr(member, "roles", ()))
+
+    def rebuild_guild(self, guild):
+        exempt = set()
+        for role in guild.roles:
+            if role.id in self.role_ids:
+                exempt.update(m.id for m in role.members)
+        self._members[guild.id] = exempt
+
+    def remove_guild(self, guild_id: int):
+        self._members.pop(guild_id, None)
+
+    def update_member(self, member):
+        exempt = self._members.get(member.guild.id)
+        if exempt is None:
+            return
+        if self.has_immune_role(member):
+            exempt.add(member.id)
+        else:
+            exempt.discard(member.id)
+
+    def remove_member(self, member):
+        exempt = self._members.get(member.guild.id)
+        if exempt is not None:
+            exempt.discard(member.id)
+
+    def is_immune(self, member) -> bool:
+        guild = getattr(member, "guild", None)
+        if guild is None:
+            return False
+        exempt = self._members.get(guild.id)
+        if exempt is None:
+            # guild not indexed yet (before on_ready): fall back to a role scan
+            return self.has_immune_role(member)
+        return member.id in exempt
+
+# ===== ENGINE =====
+class ModerationResult:
+    """Outcome of ModerationEngine.check()."""
+    __slots__ = ("content", "words", "immune")
+
+    def __init__(self, content: str, words: list, immune: bool = False):
+        self.content = content  # normalized content
+        self.words = words      # banned words hit (whitelist already applied)
+        self.immune = immune    # author is exempt from moderation
+
+    @property
+    def flagged(self) -> bool:
+        return bool(self.words)
+
+    @property
+    def violation(self) -> bool:
+        return bool(self.words) and not self.immune
+
+
+class ModerationEngine:
+    """Single moderation entry point shared by new messages and edits."""
+
+    def __init__(self, rules: RulesetCache, immunity: ImmunityIndex = None, fuzzy: bool = False):
+        self.rules = rules
+        self.immunity = immunity or ImmunityIndex()
+        self.fuzzy = fuzzy
+
+    def digest_key(self, content: str) -> tuple:
+        """The normalized forms check() looks at; texts with the same key get the same verdict."""
+        thai = normalize_thai(content) if has_thai(content) else ""
+        tokens = tuple(normalize_word(token) for token in content.split()) if self.fuzzy else ()
+        return normalize_for_matching(content), thai, tokens
+
+    def check(self, content: str, author=None) -> ModerationResult:
+        normalized = normalize_for_matching(content)
+        guild = getattr(author, "guild", None)
+        ruleset = self.rules.get(guild.id if guild else None)
+        words, whitelisted = ruleset.scan(normalized)
+        if not words and not whitelisted and self.fuzzy:
+            # obfuscated spellings: look each word of the message up in the fuzzy index
+            words = ruleset.fuzzy_hits(content.split())
+        if ruleset.thai_matcher is not None and has_thai(content):
+            # Thai is scanned on its own: only Thai whitelist entries exempt it, not English ones
+            thai_words, _ = ruleset.scan_thai(normalize_thai(content))
+            words = words + thai_words
+        immune = bool(words) and author is not None and self.immunity.is_immune(author)
+        return ModerationResult(normalized, words, immune)
+
+
+# ===== RAID DETECTION =====
+class SlidingWindowCounter:
+    """Event timestamps in a ring buffer; count() is the number inside the window."""
+    __slots__ = ("window", "_times")
+
+    def __init__(self, window: float, maxlen: int = 256):
+        self.window = window
+        self._times = deque(maxlen=maxlen)
+
+    def add(self, now: float) -> int:
+        self._times.append(now)
+        return self.count(now)
+
+    def count(self, now: float) -> int:
+        times, cutoff = self._times, now - self.window
+        while times and times[0] < cutoff:
+            times.popleft()
+        return len(times)
+
+
+class DuplicateCounter:
+    """How many times each content hash was seen inside the window."""
+    __slots__ = ("window", "_events", "_counts")
+
+    def __init__(self, window: float, maxlen: int = 512):
+        self.window = window
+        self._events = deque(maxlen=maxlen)
+        self._counts = {}
+
+    def _evict(self, digest):
+        left = self._counts.get(digest, 0) - 1
+        if left > 0:
+            self._counts[digest] = left
+        else:
+            self._counts.pop(digest, None)
+
+    def add(self, digest, now: float) -> int:
+        events, cutoff = self._events, now - self.window
+        while events and events[0][0] < cutoff:
+            self._evict(events.popleft()[1])
+        if len(events) == events.maxlen:
+            self._evict(events[0][1])  # about to fall off the ring
+        events.append((now, digest))
+        count = self._counts.get(digest, 0) + 1
+        self._counts[digest] = count
+        return count
+
+
+class RaidVerdict:
+    """Outcome of RaidDetector.observe() for one message."""
+    __slots__ = ("raid", "changed", "reason", "duplicates")
+
+    def __init__(self, raid: bool, changed: bool, reason: str, duplicates: int):
+        self.raid = raid              # channel is in raid (cheap-path) mode
+        self.changed = changed        # this message switched the mode on or off
+        self.reason = reason          # which threshold tripped, when switching on
+        self.duplicates = duplicates  # copies of this content inside the window
+
+
+class RaidDetector:
+    """Per-channel and per-user flood detection over sliding windows.
+
+    A channel enters raid mode when its message rate, the rate of identical
+    messages, or the rate of messages from new accounts crosses a threshold,
+    and leaves it once it has been quiet for `cooldown` seconds. Messages
+    shorter than duplicate_min_length (attachment-only posts, "gg", "lol")
+    are not counted as duplicates.
+    """
+
+    def __init__(
+        self,
+        window: float = 5.0,
+        channel_rate: int = 25,
+        user_rate: int = 8,
+        duplicate_rate: int = 6,
+        new_account_rate: int = 10,
+        new_account_age: float = 7 * 86400,
+        cooldown: float = 30.0,
+        duplicate_min_length: int = 8,
+    ):
+        self.window = window
+        self.channel_rate = channel_rate
+        self.user_rate = user_rate
+        self.duplicate_rate = duplicate_rate
+        self.new_account_rate = new_account_rate
+        self.new_account_age = new_account_age
+        self.cooldown = cooldown
+        self.duplicate_min_length = duplicate_min_length
+
+        self._channel = {}     # channel_id -> SlidingWindowCounter
+        self._users = {}       # user_id -> SlidingWindowCounter
+        self._new_accounts = {}  # channel_id -> SlidingWindowCounter
+        self._duplicates = {}  # channel_id -> DuplicateCounter
+        self._raid_until = {}  # channel_id -> monotonic time raid mode ends (present = raid mode)
+
+    def in_raid(self, channel_id) -> bool:
+        return channel_id in self._raid_until
+
+    def active_channels(self) -> list:
+        return list(self._raid_until)
+
+    def observe(self, channel_id, user_id, content: str, account_age: float = None, now: float = None) -> RaidVerdict:
+        now = time.monotonic() if now is None else now
+        channel_count = self._channel.setdefault(channel_id, SlidingWindowCounter(self.window, self.channel_rate * 4)).add(now)
+        user_count = self._users.setdefault(user_id, SlidingWindowCounter(self.window, self.user_rate * 4)).add(now)
+        duplicates = 0
+        if len(content.strip()) >= self.duplicate_min_length:
+            duplicates = self._duplicates.setdefault(channel_id, DuplicateCounter(self.window)).add(hash(content), now)
+
+        new_count = 0
+        if account_age is not None and account_age < self.new_account_age:
+            new_count = self._new_accounts.setdefault(
+                channel_id, SlidingWindowCounter(self.window * 12, self.new_account_rate * 4)
+            ).add(now)
+
+        reason = None
+        if channel_count >= self.channel_rate:
+            reason = f"{channel_count} messages in {self.window:g}s"
+        elif duplicates >= self.duplicate_rate:
+            reason = f"{duplicates} identical messages in {self.window:g}s"
+        elif user_count >= self.user_rate:
+            reason = f"one user sent {user_count} messages in {self.window:g}s"
+        elif new_count >= self.new_account_rate:
+            reason = f"{new_count} messages from new accounts in {self.window * 12:g}s"
+
+        active = channel_id in self._raid_until
+        if reason:
+            self._raid_until[channel_id] = now + self.cooldown
+            return RaidVerdict(True, not active, reason, duplicates)
+        if active and self._raid_until[channel_id] <= now:
+            del self._raid_until[channel_id]
+            return RaidVerdict(False, True, None, duplicates)
+        return RaidVerdict(active, False, None, duplicates)
+
+    def expired(self, now: float = None) -> list:
+        """Channel IDs whose raid mode ran out since the last call; also drops idle counters."""
+        now = time.monotonic() if now is None else now
+        ended = [cid for cid, until in self._raid_until.items() if until <= now]
+        for cid in ended:
+            del self._raid_until[cid]
+
+        for counters in (self._users, self._channel, self._new_accounts):
+            for key in [k for k, c in counters.items() if not c.count(now)]:
+                del counters[key]
+        for key in [k for k in self._duplicates if k not in self._channel]:
+            del self._duplicates[key]
+        return ended
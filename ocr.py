@@ -0,0 +1,467 @@
+'''
+Image attachment moderation for BestBotEver!!!: OCR and the banned-image list.
+Decoding, hashing and tesseract run in worker processes. Workers import this
+module only, so it must stay free of Discord/console side effects.
+'''
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import combinations
+from statistics import median
+import asyncio
+import io
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import sys
+import types
+
+
+# ===== TESSERACT =====
+TESSERACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tesseract")
+OCR_LANGS = "eng+tha"
+
+
+def find_tesseract():
+    """The bundled tesseract.exe on Windows, otherwise the tesseract binary on PATH."""
+    bundled = os.path.join(TESSERACT_DIR, "tesseract.exe")
+    if platform.system() == "Windows" and os.path.exists(bundled):
+        return bundled
+    return shutil.which("tesseract")
+
+
+def find_tessdata(langs: str = OCR_LANGS):
+    """The bundled tessdata folder if it has every language, else None (tesseract's own)."""
+    tessdata = os.path.join(TESSERACT_DIR, "tessdata")
+    if all(os.path.exists(os.path.join(tessdata, f"{lang}.traineddata")) for lang in langs.split("+")):
+        return tessdata
+    return None
+
+
+# ===== WORKER SIDE =====
+# Everything in this section runs inside the process pool.
+MAX_OCR_SIDE = 2000     # longer sides get scaled down before OCR
+MIN_OCR_SIDE = 600      # shorter ones get scaled up, tesseract struggles with tiny text
+_worker = {"cmd": None, "config": "", "langs": OCR_LANGS}
+
+
+def init_worker(tesseract_cmd, tessdata=None, langs: str = OCR_LANGS):
+    _worker["cmd"] = tesseract_cmd
+    _worker["config"] = f'--tessdata-dir "{tessdata}"' if tessdata else ""
+    _worker["langs"] = langs
+
+
+def _open_image(data: bytes):
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    image.seek(0)  # first frame of GIFs / animated WebP
+    return image.convert("L")
+
+
+# pHash: 32x32 greyscale DCT, keep the 8x8 lowest frequencies, one bit per coefficient
+DCT_SIZE = 32
+HASH_SIZE = 8
+_DCT_BASIS = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * DCT_SIZE)) for x in range(DCT_SIZE)]
+    for u in range(HASH_SIZE)
+]
+
+
+def phash(image) -> int:
+    """64-bit perceptual hash of a PIL image; resized or recompressed copies stay within a few bits."""
+    from PIL import Image
+
+    pixels = list(image.convert("L").resize((DCT_SIZE, DCT_SIZE), Image.LANCZOS).tobytes())
+    rows = [pixels[i * DCT_SIZE:(i + 1) * DCT_SIZE] for i in range(DCT_SIZE)]
+    # separable DCT: along each row first, then down the columns of that result
+    partial = [[sum(b * p for b, p in zip(basis, row)) for basis in _DCT_BASIS] for row in rows]
+    coeffs = [
+        sum(basis[y] * partial[y][v] for y in range(DCT_SIZE))
+        for basis in _DCT_BASIS
+        for v in range(HASH_SIZE)
+    ]
+    cut = median(coeffs)
+    value = 0
+    for c in coeffs:
+        value = (value << 1) | (c > cut)
+    return value
+
+
+def hash_image(data: bytes):
+    """pHash of encoded image bytes, None if they are not a readable image."""
+    try:
+        return phash(_open_image(data))
+    except Exception:
+        return None
+
+
+def ocr_image(data: bytes) -> str:
+    """Text tesseract finds in encoded image bytes."""
+    import pytesseract
+    from PIL import Image
+
+    if _worker["cmd"]:
+        pytesseract.pytesseract.tesseract_cmd = _worker["cmd"]
+    image = _open_image(data)
+    longest = max(image.size)
+    if longest > MAX_OCR_SIDE:
+        scale = MAX_OCR_SIDE / longest
+    elif longest < MIN_OCR_SIDE:
+        scale = MIN_OCR_SIDE / longest
+    else:
+        scale = 1
+    if scale != 1:
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+    return pytesseract.image_to_string(image, lang=_worker["langs"], config=_worker["config"])
+
+
+# ===== HAMMING INDEX =====
+HASH_BITS = 64
+INDEX_BLOCKS = 4
+BLOCK_BITS = HASH_BITS // INDEX_BLOCKS
+BLOCK_MASK = (1 << BLOCK_BITS) - 1
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _flip_masks(radius: int) -> list:
+    """Every BLOCK_BITS-bit mask with at most radius bits set."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(BLOCK_BITS), r):
+            mask = 0
+            for bit in bits:
+                mask |= 1 << bit
+            masks.append(mask)
+    return masks
+
+
+class HammingIndex:
+    """Multi-index hashing over 64-bit hashes.
+
+    Each hash is split into 4 blocks of 16 bits, with one table per block. Two
+    hashes within radius bits of each other must agree on some block to within
+    radius // 4 bits (pigeonhole), so a search only probes those block values
+    and checks the few candidates it finds, instead of scanning every hash.
+    """
+
+    def __init__(self, radius: int = 6):
+        self.radius = radius
+        self._masks = _flip_masks(radius // INDEX_BLOCKS)
+        self._tables = [{} for _ in range(INDEX_BLOCKS)]
+        self._hashes = set()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, value):
+        return value in self._hashes
+
+    @staticmethod
+    def _blocks(value: int):
+        return [(value >> (i * BLOCK_BITS)) & BLOCK_MASK for i in range(INDEX_BLOCKS)]
+
+    def add(self, value: int):
+        if value in self._hashes:
+            return
+        self._hashes.add(value)
+        for table, block in zip(self._tables, self._blocks(value)):
+            table.setdefault(block, set()).add(value)
+
+    def discard(self, value: int):
+        if value not in self._hashes:
+            return
+        self._hashes.discard(value)
+        for table, block in zip(self._tables, self._blocks(value)):
+            bucket = table.get(block)
+            if bucket is not None:
+                bucket.discard(value)
+                if not bucket:
+                    del table[block]
+
+    def search(self, value: int, radius: int = None) -> list:
+        """(distance, hash) pairs within radius of value, closest first."""
+        radius = self.radius if radius is None else min(radius, self.radius)
+        if value in self._hashes and radius == 0:
+            return [(0, value)]
+        candidates = set()
+        for table, block in zip(self._tables, self._blocks(value)):
+            for mask in self._masks:
+                bucket = table.get(block ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+        hits = [(hamming(value, c), c) for c in candidates]
+        return sorted(hit for hit in hits if hit[0] <= radius)
+
+
+# ===== IMAGE BLOCKLIST =====
+class ImageBlocklist:
+    """Banned image hashes, stored as JSON and searched through HammingIndexes.
+
+    Like banned_words.json, the top-level "images" are global (owner only) and
+    a guild listed under "guilds" has its own list; an attachment is checked
+    against the global list plus its guild's. File layout:
+    {"max_distance": 6, "images": [{"hash": "<16 hex digits>", ...}], "guilds": {"<id>": [...]}}.
+    Anything besides "hash" (source link, who added it, when) is kept as is.
+    """
+
+    def __init__(self, path: str, max_distance: int = 6):
+        self.path = path
+        self.max_distance = max_distance
+        self.entries = {None: {}}  # guild_id (None = global) -> hash -> entry dict
+        self.indexes = {None: HammingIndex(max_distance)}
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+    def active(self, guild_id=None) -> bool:
+        """Whether any image is banned for guild_id (globally or in that guild)."""
+        return bool(self.entries[None] or self.entries.get(guild_id))
+
+    def _scope(self, guild_id):
+        if guild_id not in self.entries:
+            self.entries[guild_id] = {}
+            self.indexes[guild_id] = HammingIndex(self.max_distance)
+        return self.entries[guild_id], self.indexes[guild_id]
+
+    def load(self):
+        data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                logging.error(f"Failed to read {self.path}: {e}")
+        self.max_distance = int(data.get("max_distance", self.max_distance))
+        self.entries = {None: {}}
+        self.indexes = {None: HammingIndex(self.max_distance)}
+        scopes = [(None, data.get("images", []))]
+        scopes += [(int(gid), images) for gid, images in data.get("guilds", {}).items()]
+        for guild_id, images in scopes:
+            entries, index = self._scope(guild_id)
+            for entry in images:
+                try:
+                    value = int(entry["hash"], 16)
+                except (KeyError, TypeError, ValueError):
+                    continue
+                entries[value] = entry
+                index.add(value)
+
+    def save(self):
+        data = {
+            "max_distance": self.max_distance,
+            "images": list(self.entries[None].values()),
+            "guilds": {str(gid): list(entries.values()) for gid, entries in self.entries.items() if gid is not None and entries},
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def add(self, value: int, guild_id=None, **info) -> tuple:
+        """Ban a hash in a guild (None = globally).
+
+        (True, the new entry), or (False, the entry that already bans it or a
+        near copy there); entries are shaped like match() results.
+        """
+        existing = self.match(value, guild_id)
+        if existing is not None:
+            return False, existing
+        entries, index = self._scope(guild_id)
+        entries[value] = {"hash": f"{value:016x}", "added": datetime.now().isoformat(timespec="seconds"), **info}
+        index.add(value)
+        self.save()
+        return True, {**entries[value], "distance": 0, "guild_id": guild_id}
+
+    def remove(self, value: int, guild_id=None) -> bool:
+        """Unban a hash from a guild's list (None = the global list)."""
+        entries = self.entries.get(guild_id)
+        if not entries or value not in entries:
+            return False
+        del entries[value]
+        self.indexes[guild_id].discard(value)
+        self.save()
+        return True
+
+    def match(self, value: int, guild_id=None):
+        """The closest banned entry within max_distance (global or guild_id's), or None."""
+        best = None
+        for scope in (None, guild_id) if guild_id is not None else (None,):
+            index = self.indexes.get(scope)
+            hits = index.search(value) if index is not None else None
+            if hits and (best is None or hits[0][0] < best[0]):
+                best = (hits[0][0], hits[0][1], scope)
+        if best is None:
+            return None
+        distance, banned, scope = best
+        return {**self.entries[scope][banned], "distance": distance, "guild_id": scope}
+
+
+# ===== POOL =====
+_WORKER_MAIN = types.ModuleType("__main__")  # no __file__ or __spec__: nothing for a worker to re-run
+
+
+@contextmanager
+def _without_main_script():
+    """Hide the parent's __main__ while pool processes may start.
+
+    spawn/forkserver children re-run the parent's main script before their
+    first task (for the bot, all of main.py). Workers only need this module,
+    which they import when unpickling the task.
+    """
+    main = sys.modules.get("__main__")
+    sys.modules["__main__"] = _WORKER_MAIN
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+# ===== SCANNER =====
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp")
+MAX_IMAGE_BYTES = 8 * 1024 * 1024
+
+
+class AttachmentScanner:
+    """Hashes and OCRs image attachments in a process pool.
+
+    pHashes are cached by attachment URL, OCR text by pHash: the same image
+    reposted many times is OCR'd once, later copies only cost a hash, and
+    copies arriving while the first is still in tesseract wait on that job
+    instead of starting their own. At most max_pending attachments (and
+    guild_pending per guild) are in flight; anything past that is skipped and
+    counted in dropped, so an image flood cannot starve the pool.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 16, guild_pending: int = 8, cache_size: int = 1024):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.guild_pending = guild_pending
+        self.cache_size = cache_size
+        self.tesseract_cmd = find_tesseract()
+        self.tessdata = find_tessdata()
+        self.dropped = 0
+        self.ocr_runs = 0
+        self.cache_hits = 0
+        self._executor = None
+        self._hashes = OrderedDict() # attachment URL (without query) -> phash
+        self._cache = OrderedDict()  # phash -> text
+        self._inflight = {}          # phash -> asyncio.Future of the running OCR job
+        self._pending = 0
+        self._guild_pending = {}     # guild_id -> attachments in flight
+
+    @property
+    def available(self) -> bool:
+        """Whether OCR can run; hashing only needs the pool."""
+        return self.tesseract_cmd is not None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=init_worker,
+                initargs=(self.tesseract_cmd, self.tessdata),
+            )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    def is_image(attachment) -> bool:
+        if attachment.size > MAX_IMAGE_BYTES:
+            return False
+        content_type = attachment.content_type or ""
+        return content_type.startswith("image/") or attachment.filename.lower().endswith(IMAGE_EXTENSIONS)
+
+    def _submit(self, loop, func, data):
+        # the pool starts its processes on demand, inside submit()
+        with _without_main_script():
+            return loop.run_in_executor(self._executor, func, data)
+
+    @staticmethod
+    def _remember(cache, key, value, maxsize):
+        cache[key] = value
+        if len(cache) > maxsize:
+            cache.popitem(last=False)
+
+    async def _hash(self, loop, attachment):
+        """(phash, bytes); bytes is None when the hash came from the URL cache."""
+        # signed CDN URLs change their query string, the path is stable per attachment
+        key = attachment.url.split("?", 1)[0]
+        digest = self._hashes.get(key)
+        if digest is not None:
+            self._hashes.move_to_end(key)
+            return digest, None
+        data = await attachment.read()
+        digest = await self._submit(loop, hash_image, data)
+        if digest is not None:
+            self._remember(self._hashes, key, digest, self.cache_size)
+        return digest, data
+
+    async def _ocr(self, loop, digest, data, attachment):
+        cached = self._cache.get(digest)
+        if cached is not None:
+            self._cache.move_to_end(digest)
+            self.cache_hits += 1
+            return cached
+        job = self._inflight.get(digest)
+        if job is not None:
+            self.cache_hits += 1
+            return await job
+
+        if data is None:
+            data = await attachment.read()
+        job = self._submit(loop, ocr_image, data)
+        self._inflight[digest] = job
+        self.ocr_runs += 1
+        try:
+            text = await job
+        finally:
+            self._inflight.pop(digest, None)
+        self._remember(self._cache, digest, text, self.cache_size)
+        return text
+
+    async def scan(self, attachment, guild_id=None, ocr: bool = True, limit: bool = True):
+        """(phash, OCR text) of an image attachment.
+
+        Either is None when skipped: not an image, queue full, unreadable, or
+        OCR not asked for / not available. limit=False bypasses the queue-depth
+        limit, for one-off commands.
+        """
+        if self._executor is None or not self.is_image(attachment):
+            return None, None
+        if limit and (self._pending >= self.max_pending or self._guild_pending.get(guild_id, 0) >= self.guild_pending):
+            self.dropped += 1
+            return None, None
+
+        self._pending += 1
+        self._guild_pending[guild_id] = self._guild_pending.get(guild_id, 0) + 1
+        digest = None
+        try:
+            loop = asyncio.get_running_loop()
+            digest, data = await self._hash(loop, attachment)
+            if digest is None or not ocr or not self.available:
+                return digest, None
+            return digest, await self._ocr(loop, digest, data, attachment)
+        except Exception as e:
+            logging.error(f"[OCR] Failed to scan {attachment.filename}: {e}")
+            return digest, None
+        finally:
+            self._pending -= 1
+            left = self._guild_pending.pop(guild_id, 1) - 1
+            if left > 0:
+                self._guild_pending[guild_id] = left
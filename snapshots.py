@@ -0,0 +1,212 @@
+'''
+User data snapshots for BestBotEver!!!: a full base snapshot now and then,
+and in between delta snapshots holding only the records that changed.
+Snapshots are gzipped and stored by content hash, so identical ones are kept once.
+
+userdata/manifest.json                  current user file, snapshot list (oldest first), newest one
+userdata/snapshots/<hash>.json.gz       base: every user (uinfo.json layout)
+                                        delta: changed users, removed IDs and the base it follows
+userdata/snapshots.state                hash of every record as of the last snapshot
+'''
+
+from datetime import datetime, timedelta
+import gzip
+import hashlib
+import json
+import os
+
+from userstore import dump_users
+
+
+SNAPSHOT_ROOT = "userdata"
+MANIFEST_FILE = "manifest.json"
+STATE_FILE = "snapshots.state"
+BLOB_FOLDER = "snapshots"
+DELTA_SUFFIX = ".delta.json"  # uncompressed deltas written before the manifest existed
+
+
+def record_hash(encoded: str) -> str:
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _load(path: str, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+class UserSnapshots:
+    """Writes userdata snapshots, as deltas against the last base when possible.
+
+    A base is written when there is none yet, when the last one is older than
+    base_interval_days, or when asked for (full=True). Otherwise only records
+    whose hash differs from the last snapshot go into a delta; nothing is
+    written if no record changed. A snapshot whose content is already stored
+    only gets a manifest entry.
+
+    Retention works on whole chains (a base and the deltas after it): chains
+    past keep_bases, or whose newest snapshot is older than keep_days (0 keeps
+    them regardless of age), are dropped; the newest chain is always kept.
+    Blocking, run save() in a thread.
+    """
+
+    def __init__(self, root: str = SNAPSHOT_ROOT, base_interval_days: float = 7, keep_bases: int = 8, keep_days: float = 0):
+        self.root = root
+        self.base_interval = timedelta(days=base_interval_days)
+        self.keep_bases = keep_bases
+        self.keep_days = keep_days
+        self.blob_root = os.path.join(root, BLOB_FOLDER)
+        self.manifest_path = os.path.join(root, MANIFEST_FILE)
+        self.state_path = os.path.join(root, STATE_FILE)
+        self.manifest = _load(self.manifest_path, {})
+        self.manifest.setdefault("current", None)
+        self.manifest.setdefault("latest", None)
+        self.manifest.setdefault("snapshots", [])
+        self._hashes = None  # loaded on the first save
+
+    # ===== MANIFEST =====
+    @property
+    def current(self):
+        """Path of the live user file, as recorded in the manifest."""
+        return self.manifest["current"]
+
+    def set_current(self, path: str):
+        self.manifest["current"] = path
+        self._save_manifest()
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        _write_atomic(self.manifest_path, json.dumps(self.manifest, indent=4).encode("utf-8"))
+
+    def _entry(self, snapshot_id):
+        for entry in reversed(self.manifest["snapshots"]):
+            if entry["id"] == snapshot_id:
+                return entry
+        return None
+
+    def latest_base(self):
+        for entry in reversed(self.manifest["snapshots"]):
+            if entry["kind"] == "base":
+                return entry
+        return None
+
+    def base_due(self, now: datetime) -> bool:
+        base = self.latest_base()
+        if base is None or not os.path.isfile(os.path.join(self.blob_root, base["blob"])):
+            return True
+        return now - datetime.fromisoformat(base["time"]) >= self.base_interval
+
+    # ===== WRITING =====
+    def _write_blob(self, text: str) -> str:
+        """Store text compressed under its content hash; the blob name (existing blobs are reused)."""
+        data = text.encode("utf-8")
+        name = hashlib.blake2b(data, digest_size=16).hexdigest() + ".json.gz"
+        path = os.path.join(self.blob_root, name)
+        if not os.path.isfile(path):
+            os.makedirs(self.blob_root, exist_ok=True)
+            _write_atomic(path, gzip.compress(data, compresslevel=6))
+        return name
+
+    def save(self, store, session_id, full: bool = False):
+        """Snapshot a user store; (snapshot id, "base"|"delta", records written), or None if nothing changed."""
+        now = datetime.now()
+        items = store.encoded_items()
+        hashes = {uid: record_hash(encoded) for uid, encoded in items}
+        if self._hashes is None:
+            self._hashes = _load(self.state_path, {}).get("hashes", {})
+
+        stamp = f"{now.strftime('%Y-%m-%d_%H-%M-%S')}-{session_id}"
+        snapshot_id, n = stamp, 1
+        while self._entry(snapshot_id) is not None:
+            snapshot_id, n = f"{stamp}_{n}", n + 1
+        entry = {"id": snapshot_id, "time": now.isoformat(timespec="seconds"), "last_saved": store.last_saved}
+        if full or self.base_due(now):
+            # last_saved lives in the manifest so unchanged data hashes the same
+            entry.update(kind="base", blob=self._write_blob(dump_users(items)), users=len(items))
+        else:
+            changed = [(uid, encoded) for uid, encoded in items if self._hashes.get(uid) != hashes[uid]]
+            removed = sorted(set(self._hashes) - set(hashes))
+            if not changed and not removed:
+                return None
+            base = self.latest_base()["id"]
+            text = dump_users(changed, removed=removed, base=base)
+            entry.update(kind="delta", blob=self._write_blob(text), base=base, users=len(changed))
+
+        self.manifest["snapshots"].append(entry)
+        self.manifest["latest"] = snapshot_id
+        self.enforce_retention(now)  # also saves the manifest
+        self._hashes = hashes
+        _write_atomic(self.state_path, json.dumps({"hashes": hashes}, separators=(",", ":")).encode("utf-8"))
+        return snapshot_id, entry["kind"], entry["users"]
+
+    # ===== RETENTION =====
+    def enforce_retention(self, now: datetime = None):
+        """Drop expired chains from the manifest, save it, then delete blobs nothing refers to.
+
+        The manifest is written first, so a crash in between leaves stray
+        blobs (removed next time) rather than a manifest pointing at deleted ones.
+        """
+        now = now or datetime.now()
+        chains = []
+        for entry in self.manifest["snapshots"]:
+            if entry["kind"] == "base" or not chains:
+                chains.append([])
+            chains[-1].append(entry)
+
+        cutoff = now - timedelta(days=self.keep_days) if self.keep_days else None
+        kept = []
+        for i, chain in enumerate(chains):
+            newest = i == len(chains) - 1
+            too_many = self.keep_bases and len(chains) - i > self.keep_bases
+            too_old = cutoff is not None and datetime.fromisoformat(chain[-1]["time"]) < cutoff
+            if newest or not (too_many or too_old):
+                kept.extend(chain)
+        self.manifest["snapshots"] = kept
+        self._save_manifest()
+
+        referenced = {entry["blob"] for entry in kept}
+        if os.path.isdir(self.blob_root):
+            for name in os.listdir(self.blob_root):
+                if name.endswith(".json.gz") and name not in referenced:
+                    os.remove(os.path.join(self.blob_root, name))
+
+    # ===== READING =====
+    def read(self, entry) -> dict:
+        with gzip.open(os.path.join(self.blob_root, entry["blob"]), "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        data["last_saved"] = entry.get("last_saved")
+        return data
+
+    def load_latest(self):
+        """User data as of the newest snapshot (its base with the deltas up to it applied), or None."""
+        latest = self._entry(self.manifest["latest"])
+        if latest is None:
+            return None
+        chain = []
+        for entry in self.manifest["snapshots"]:
+            if entry["kind"] == "base":
+                chain = []
+            chain.append(entry)
+            if entry is latest:
+                break
+        if chain[0]["kind"] != "base":
+            return None  # base pruned or missing
+
+        data = self.read(chain[0])
+        users = data["discord_users"]
+        for entry in chain[1:]:
+            delta = self.read(entry)
+            users.update(delta["discord_users"])
+            for uid in delta.get("removed", ()):
+                users.pop(uid, None)
+        data["last_saved"] = latest.get("last_saved")
+        return {"discord_users": users, "last_saved": data["last_saved"]}
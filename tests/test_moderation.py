@@ -0,0 +1,107 @@
+'''
+Tests for moderation.py: word-list normalization and the banned-word check.
+No Discord needed; rulesets are loaded from a temporary banned-words file.
+'''
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from moderation import ContentDigestCache, ModerationEngine, RulesetCache, normalize_for_matching, normalize_thai, normalize_word
+
+
+def write_words(path, banned=(), whitelist=(), **extra):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"banned_words": list(banned), "whitelisted_words": list(whitelist), **extra}, f, ensure_ascii=False)
+
+
+@pytest.fixture
+def words_file(tmp_path):
+    return str(tmp_path / "banned_words.json")
+
+
+def engine_for(path, fuzzy: bool = False):
+    rules = RulesetCache(path, normalize=normalize_word, check_interval=0)
+    rules.reload()
+    return ModerationEngine(rules, fuzzy=fuzzy)
+
+
+# ===== WORD LISTS =====
+def test_listed_words_fold_like_messages(words_file):
+    # "baaad" only reaches the matcher as "bad" once its letter run is collapsed
+    write_words(words_file, banned=["baaad", "n1gga", "fück"], whitelist=["baaadminton"])
+    engine = engine_for(words_file)
+    assert engine.check("so baaaaad").words == ["bad"]
+    assert engine.check("BAD").flagged
+    assert engine.check("nigga").flagged
+    assert engine.check("fuck").flagged
+    assert not engine.check("badminton later?").flagged
+
+
+# ===== THAI =====
+def test_sara_am_spellings_match_each_other(words_file):
+    precomposed, decomposed = "\u0E19\u0E49\u0E33", "\u0E19\u0E49\u0E4D\u0E32"  # น้ำ typed two ways
+    write_words(words_file, banned=[precomposed])
+    assert engine_for(words_file).check(f"ดื่ม{decomposed}").flagged
+    assert engine_for(words_file).check("\u0E19\u0E4D\u0E49\u0E32 เย็น").flagged  # nikhahit before the tone mark
+    write_words(words_file, banned=[decomposed])
+    assert engine_for(words_file).check(f"ดื่ม{precomposed}").flagged
+    assert not engine_for(words_file).check("\u0E19\u0E32").flagged  # plain sara aa is another word
+
+
+def test_thai_pass_only_runs_on_thai_text(words_file):
+    write_words(words_file, banned=["นิกก้า"], whitelist=["morning"])
+    engine = engine_for(words_file)
+    before = normalize_thai.cache_info()
+    assert not engine.check("café time 🎉").flagged
+    assert normalize_thai.cache_info() == before
+    assert engine.check("good morning นิกก้า").flagged
+
+
+# ===== FUZZY MATCHING =====
+def test_fuzzy_tokens_do_not_fill_the_message_cache(words_file):
+    write_words(words_file, banned=["niggurt"], fuzzy_tolerance={"niggurt": 2})
+    engine = engine_for(words_file, fuzzy=True)
+    before = normalize_for_matching.cache_info().currsize
+    assert engine.check("you are a nigurtt, a reeeal one x" + "y" * 2000).words == ["niggurt"]
+    assert not engine.check("a fine sentence with several tokens").flagged
+    assert normalize_for_matching.cache_info().currsize - before == 2  # one entry per message
+    assert not engine_for(words_file).check("you are a nigurtt").flagged  # fuzzy is opt-in
+
+
+# ===== RELOADING =====
+def test_bad_file_is_skipped_until_it_changes(words_file, monkeypatch):
+    write_words(words_file, banned=["bad"])
+    rules = RulesetCache(words_file, normalize=normalize_word, check_interval=0)
+    good = rules.get()
+
+    with open(words_file, "w", encoding="utf-8") as f:
+        f.write("{ not json")
+    os.utime(words_file, ns=(1, 1))
+    reloads = []
+    original = rules.reload
+    monkeypatch.setattr(rules, "reload", lambda: reloads.append(1) or original())
+    for _ in range(3):
+        assert rules.get() is good
+    assert len(reloads) == 1
+
+    write_words(words_file, banned=["worse"])
+    os.utime(words_file, ns=(2, 2))
+    assert rules.get().banned == {"worse"}
+
+
+# ===== EDIT DEDUP =====
+def test_edits_normalizing_to_checked_text_are_skipped(words_file):
+    write_words(words_file, banned=["bad"])
+    engine = engine_for(words_file)
+    digests = ContentDigestCache()
+    assert digests.update(1, engine.digest_key("see you at nine"))  # the original message
+    assert digests.update(1, engine.digest_key("see you at ten"))
+    assert not digests.update(1, engine.digest_key("See you at TEN!!"))
+    assert not digests.update(1, engine.digest_key("see  you at ten."))
+    # Thai is normalized separately, so a Thai-only change still counts
+    assert digests.update(1, engine.digest_key("see you at ten ครับ"))
@@ -0,0 +1,206 @@
+'''
+Tests for ocr.py: perceptual hashing, the Hamming index, the banned-image
+list and the attachment scanner. No Discord needed; OCR tests are skipped
+when tesseract is not installed.
+'''
+
+import asyncio
+import io
+import os
+import random
+import sys
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr
+from ocr import AttachmentScanner, HammingIndex, ImageBlocklist, hamming, hash_image, phash
+
+
+def sample_image(seed: int = 1, size=(400, 300)) -> Image.Image:
+    """Random shapes on a gradient, different per seed."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", size)
+    draw = ImageDraw.Draw(image)
+    for x in range(size[0]):
+        draw.line([(x, 0), (x, size[1])], fill=(x * 255 // size[0], 80, 160))
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        w, h = rng.randrange(20, 150), rng.randrange(20, 150)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle([x, y, x + w, y + h], fill=color)
+        else:
+            draw.ellipse([x, y, x + w, y + h], fill=color)
+    return image
+
+
+def encode(image: Image.Image, fmt: str = "PNG", **params) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **params)
+    return buffer.getvalue()
+
+
+def flip_bits(value: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+# ===== PHASH =====
+def test_phash_survives_resize_and_recompression():
+    image = sample_image()
+    original = phash(image)
+    smaller = phash(image.resize((200, 150), Image.BILINEAR))
+    larger = phash(image.resize((1024, 768), Image.BICUBIC))
+    jpeg = hash_image(encode(image, "JPEG", quality=40))
+    for copy in (smaller, larger, jpeg):
+        assert hamming(original, copy) <= 6
+
+
+def test_phash_separates_different_images():
+    hashes = [phash(sample_image(seed)) for seed in range(1, 6)]
+    for i, a in enumerate(hashes):
+        for b in hashes[i + 1:]:
+            assert hamming(a, b) > 6
+
+
+def test_hash_image_rejects_non_images():
+    assert hash_image(b"not an image") is None
+
+
+# ===== HAMMING INDEX =====
+def test_hamming_index_matches_linear_scan():
+    rng = random.Random(7)
+    stored = [rng.getrandbits(64) for _ in range(2000)]
+    # near copies of stored hashes at every distance up to and past the radius
+    stored += [flip_bits(stored[i], rng.randrange(1, 9), rng) for i in range(300)]
+    index = HammingIndex(radius=6)
+    for value in stored:
+        index.add(value)
+
+    queries = [flip_bits(rng.choice(stored), rng.randrange(0, 9), rng) for _ in range(500)]
+    queries += [rng.getrandbits(64) for _ in range(100)]
+    for query in queries:
+        expected = sorted((hamming(query, v), v) for v in set(stored) if hamming(query, v) <= 6)
+        assert index.search(query) == expected
+
+
+def test_hamming_index_discard():
+    index = HammingIndex(radius=6)
+    index.add(0xFFFF)
+    index.add(0xFFFE)
+    index.discard(0xFFFF)
+    assert 0xFFFF not in index
+    assert len(index) == 1
+    assert index.search(0xFFFF) == [(1, 0xFFFE)]
+
+
+# ===== BLOCKLIST =====
+def test_blocklist_matches_near_copies_and_persists(tmp_path):
+    path = str(tmp_path / "banned_images.json")
+    blocklist = ImageBlocklist(path)
+    image = sample_image()
+    banned = phash(image)
+    assert blocklist.add(banned, added_by="1")[0]
+    is_new, existing = blocklist.add(flip_bits(banned, 2, random.Random(3)))  # near copy already banned
+    assert not is_new and existing["hash"] == f"{banned:016x}" and existing["distance"] == 2
+
+    reloaded = ImageBlocklist(path)
+    reloaded.load()
+    hit = reloaded.match(hash_image(encode(image.resize((300, 225)), "JPEG", quality=60)))
+    assert hit is not None and hit["added_by"] == "1"
+    assert reloaded.match(phash(sample_image(seed=2))) is None
+
+    assert reloaded.remove(banned)
+    assert reloaded.match(banned) is None
+
+
+def test_blocklist_guild_scopes(tmp_path):
+    path = str(tmp_path / "banned_images.json")
+    blocklist = ImageBlocklist(path)
+    global_image, guild_image = phash(sample_image(seed=1)), phash(sample_image(seed=2))
+    assert blocklist.add(global_image)[0]
+    assert blocklist.add(guild_image, 111) == (True, {**blocklist.entries[111][guild_image], "distance": 0, "guild_id": 111})
+    is_new, existing = blocklist.add(global_image, 111)  # already banned everywhere
+    assert not is_new and existing["guild_id"] is None
+
+    reloaded = ImageBlocklist(path)
+    reloaded.load()
+    assert reloaded.match(guild_image, 111)["guild_id"] == 111
+    assert reloaded.match(guild_image, 222) is None
+    assert reloaded.match(guild_image) is None
+    assert reloaded.match(global_image, 222)["guild_id"] is None
+    assert reloaded.active(222) and not ImageBlocklist(str(tmp_path / "none.json")).active(222)
+
+    # a guild cannot unban a global image, nor another guild's
+    assert not reloaded.remove(global_image, 111)
+    assert not reloaded.remove(guild_image, 222)
+    assert reloaded.remove(guild_image, 111)
+    assert reloaded.match(guild_image, 111) is None
+
+
+# ===== SCANNER =====
+class FakeAttachment:
+    def __init__(self, data: bytes, url: str, filename: str = "image.png"):
+        self.data = data
+        self.url = url
+        self.filename = filename
+        self.size = len(data)
+        self.content_type = "image/png"
+        self.reads = 0
+
+    async def read(self):
+        self.reads += 1
+        return self.data
+
+
+@pytest.fixture
+def scanner():
+    scanner = AttachmentScanner(workers=1, max_pending=4, guild_pending=2)
+    scanner.start()
+    yield scanner
+    scanner.shutdown()
+
+
+def test_scanner_hashes_once_per_url(scanner):
+    data = encode(sample_image())
+    first = FakeAttachment(data, "https://cdn.example/a/1/image.png?ex=1")
+    again = FakeAttachment(data, "https://cdn.example/a/1/image.png?ex=2")  # re-signed URL
+
+    async def run():
+        return await scanner.scan(first, ocr=False), await scanner.scan(again, ocr=False)
+
+    (digest, text), (digest_again, _) = asyncio.run(run())
+    assert digest == phash(sample_image()) and text is None
+    assert digest_again == digest
+    assert again.reads == 0
+
+
+def test_scanner_skips_non_images_and_full_queue(scanner):
+    not_image = FakeAttachment(b"text", "https://cdn.example/a/2/notes.txt", "notes.txt")
+    not_image.content_type = "text/plain"
+    assert asyncio.run(scanner.scan(not_image)) == (None, None)
+
+    scanner._pending = scanner.max_pending
+    assert asyncio.run(scanner.scan(FakeAttachment(encode(sample_image()), "https://cdn.example/a/3/x.png"))) == (None, None)
+    assert scanner.dropped == 1
+
+
+@pytest.mark.skipif(ocr.find_tesseract() is None, reason="tesseract not installed")
+def test_scanner_ocrs_text_once_per_image(scanner):
+    image = Image.new("RGB", (800, 200), "white")
+    ImageDraw.Draw(image).text((40, 60), "HELLO WORLD", fill="black", font=ImageFont.load_default(size=72))
+    data = encode(image)
+
+    async def run():
+        first = await scanner.scan(FakeAttachment(data, "https://cdn.example/a/4/text.png"))
+        repost = await scanner.scan(FakeAttachment(data, "https://cdn.example/a/5/text.png"))
+        return first, repost
+
+    (_, text), (_, repost_text) = asyncio.run(run())
+    assert "HELLO" in text.upper()
+    assert repost_text == text
+    assert scanner.ocr_runs == 1 and scanner.cache_hits == 1
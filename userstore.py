@@ -0,0 +1,409 @@
+'''
+User record stores for BestBotEver!!!, both with the same interface
+(get/put/put_many/update/find_name/count/snapshot, last_saved, flush).
+
+JsonUserStore    write-behind JSON: changes mark records dirty and a background
+                 thread rewrites the file at most every flush_interval seconds.
+SqliteUserStore  one row per user in SQLite (WAL); nothing is loaded at startup
+                 and a single-record update is a single row write.
+'''
+
+from bisect import bisect_left
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+
+def dump_users(encoded_items, last_saved=None, **extra) -> str:
+    """uinfo.json text from (uid, encoded record) pairs, one record per line.
+
+    Keeps the file readable without re-indenting every record; extra top-level
+    fields (already JSON-serializable) go after last_saved.
+    """
+    lines = [f"        {json.dumps(uid)}: {encoded}" for uid, encoded in encoded_items]
+    tail = "".join(f',\n    {json.dumps(k)}: {json.dumps(v, ensure_ascii=False)}' for k, v in extra.items())
+    return (
+        '{\n    "discord_users": {\n'
+        + ",\n".join(lines)
+        + f'\n    }},\n    "last_saved": {json.dumps(last_saved)}{tail}\n}}\n'
+    )
+
+
+def name_key(name) -> str:
+    """Lookup form of a display name or username (case-insensitive)."""
+    return str(name).casefold().strip() if name else ""
+
+
+class NameIndex:
+    """Display name and username -> user IDs, kept up to date as records change.
+
+    Keys are casefolded. Prefix search bisects a sorted key list that is only
+    rebuilt after a name was added or removed.
+    """
+
+    def __init__(self):
+        self._ids = {}    # key -> set of user IDs
+        self._keys = {}   # user ID -> keys it is filed under
+        self._sorted = None
+
+    def update(self, uid: str, record: dict):
+        keys = {name_key(record.get("dispname")), name_key(record.get("username"))} - {""}
+        old = self._keys.get(uid, set())
+        if keys == old:
+            return
+        for key in old - keys:
+            ids = self._ids[key]
+            ids.discard(uid)
+            if not ids:
+                del self._ids[key]
+                self._sorted = None
+        for key in keys - old:
+            if key not in self._ids:
+                self._ids[key] = set()
+                self._sorted = None
+            self._ids[key].add(uid)
+        self._keys[uid] = keys
+
+    def discard(self, uid: str):
+        self.update(uid, {})
+        self._keys.pop(uid, None)
+
+    def exact(self, name: str) -> list:
+        return sorted(self._ids.get(name_key(name), ()))
+
+    def prefix(self, prefix: str, limit: int = 25) -> list:
+        prefix = name_key(prefix)
+        if not prefix:
+            return []
+        if self._sorted is None:
+            self._sorted = sorted(self._ids)
+        found = []
+        for key in self._sorted[bisect_left(self._sorted, prefix):]:
+            if not key.startswith(prefix):
+                break
+            for uid in sorted(self._ids[key]):
+                if uid not in found:
+                    found.append(uid)
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+
+class JsonUserStore:
+    """user_info ({"discord_users": {id: record}, "last_saved": ...}) with write-behind saving.
+
+    Every mutation must be followed by touch(uid), which re-encodes that one
+    record (cheap, on the caller's thread) and marks the store dirty. The
+    flusher thread only joins the already-encoded records, writes a temp file
+    and renames it over the old one, so a burst of edits costs one write and
+    the event loop never serializes the whole user database.
+    """
+
+    def __init__(self, path: str, data: dict = None, flush_interval: float = 5.0):
+        self.path = path
+        self.data = data if data is not None else {"discord_users": {}, "last_saved": None}
+        self.data.setdefault("discord_users", {})
+        self.flush_interval = flush_interval
+        self.writes = 0
+        self._encoded = {uid: self._encode(record) for uid, record in self.users.items()}
+        self.names = NameIndex()
+        for uid, record in self.users.items():
+            self.names.update(uid, record)
+        self._dirty = False
+        self._lock = threading.Lock()        # guards _encoded / _dirty
+        self._write_lock = threading.Lock()  # one writer at a time
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="user-store", daemon=True)
+
+    @property
+    def users(self) -> dict:
+        return self.data["discord_users"]
+
+    @staticmethod
+    def _encode(record) -> str:
+        return json.dumps(record, ensure_ascii=False)
+
+    def get(self, uid):
+        return self.users.get(str(uid))
+
+    def put(self, uid, record: dict) -> dict:
+        self.users[str(uid)] = record
+        self.touch(uid)
+        return record
+
+    def put_many(self, records):
+        for record in records:
+            self.put(record["id"], record)
+
+    def update(self, uid, fields: dict):
+        """Set some fields of an existing record; None if there is no such user."""
+        record = self.users.get(str(uid))
+        if record is None:
+            return None
+        record.update(fields)
+        self.touch(uid)
+        return record
+
+    def find_name(self, name: str) -> list:
+        """Users whose display name or username is name, ignoring case."""
+        return [self.users[uid] for uid in self.names.exact(name)]
+
+    def find_prefix(self, prefix: str, limit: int = 25) -> list:
+        """Users whose display name or username starts with prefix, ignoring case."""
+        return [self.users[uid] for uid in self.names.prefix(prefix, limit)]
+
+    def count(self) -> int:
+        return len(self.users)
+
+    @property
+    def last_saved(self):
+        return self.data.get("last_saved")
+
+    @last_saved.setter
+    def last_saved(self, value):
+        self.data["last_saved"] = value
+        self.touch()
+
+    def snapshot(self) -> dict:
+        return self.data
+
+    def encoded_items(self) -> list:
+        """(uid, record as JSON) for every user, safe to call from any thread."""
+        with self._lock:
+            return list(self._encoded.items())
+
+    def touch(self, uid=None):
+        """Mark a record (or just the top-level fields, uid=None) as changed."""
+        with self._lock:
+            if uid is not None:
+                record = self.users.get(str(uid))
+                if record is None:
+                    self._encoded.pop(str(uid), None)
+                    self.names.discard(str(uid))
+                else:
+                    self._encoded[str(uid)] = self._encode(record)
+                    self.names.update(str(uid), record)
+            self._dirty = True
+
+    # ===== FLUSHING =====
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Failed to write {self.path}: {e}")
+
+    def flush(self) -> bool:
+        """Write the file now if anything changed; False if there was nothing to write."""
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return False
+                records = list(self._encoded.items())
+                last_saved = self.data.get("last_saved")
+                self._dirty = False
+
+            text = dump_users(records, last_saved)
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                with self._lock:
+                    self._dirty = True  # try again next round
+                raise
+            self.writes += 1
+            return True
+
+
+# ===== SQLITE =====
+USER_DB_PATH = "userdata/users.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    dispname TEXT,
+    username TEXT,
+    data TEXT NOT NULL,
+    dispname_key TEXT,
+    username_key TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# created after the name_key columns exist (databases from before them get them added)
+INDEXES = """
+CREATE INDEX IF NOT EXISTS users_dispname ON users(dispname);
+CREATE INDEX IF NOT EXISTS users_dispname_key ON users(dispname_key);
+CREATE INDEX IF NOT EXISTS users_username_key ON users(username_key);
+"""
+
+UPSERT = """
+INSERT INTO users (id, dispname, username, data, dispname_key, username_key) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET dispname = excluded.dispname, username = excluded.username, data = excluded.data,
+    dispname_key = excluded.dispname_key, username_key = excluded.username_key
+"""
+
+# sorts after every string a prefix can be followed by
+PREFIX_END = "\U0010ffff"
+
+
+class SqliteUserStore:
+    """User records as rows of a WAL-mode SQLite database.
+
+    The full record is kept as JSON in one column, with id (primary key),
+    dispname and casefolded display name / username (indexed) pulled out for
+    lookups. Each call is its own short
+    transaction, so there is nothing to flush; get() returns a copy and
+    changes go through put()/update().
+    """
+
+    def __init__(self, path: str = USER_DB_PATH):
+        self.path = path
+        self.writes = 0
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(users)")}
+        if "dispname_key" not in columns:
+            self._conn.create_function("name_key", 1, name_key, deterministic=True)
+            with self._conn:
+                self._conn.execute("ALTER TABLE users ADD COLUMN dispname_key TEXT")
+                self._conn.execute("ALTER TABLE users ADD COLUMN username_key TEXT")
+                self._conn.execute("UPDATE users SET dispname_key = name_key(dispname), username_key = name_key(username)")
+        self._conn.executescript(INDEXES)
+
+    @staticmethod
+    def _row(record: dict) -> tuple:
+        return (
+            str(record["id"]),
+            record.get("dispname"),
+            record.get("username"),
+            json.dumps(record, ensure_ascii=False),
+            name_key(record.get("dispname")),
+            name_key(record.get("username")),
+        )
+
+    def _write(self, sql: str, params):
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+        self.writes += 1
+
+    def get(self, uid):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM users WHERE id = ?", (str(uid),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, uid, record: dict) -> dict:
+        record["id"] = str(uid)
+        self._write(UPSERT, self._row(record))
+        return record
+
+    def put_many(self, records):
+        """Upsert many records in one transaction."""
+        with self._lock, self._conn:
+            self._conn.executemany(UPSERT, (self._row(r) for r in records))
+        self.writes += 1
+
+    def update(self, uid, fields: dict):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT data FROM users WHERE id = ?", (str(uid),)).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[0])
+            record.update(fields)
+            self._conn.execute(
+                "UPDATE users SET dispname = ?, username = ?, data = ?, dispname_key = ?, username_key = ? WHERE id = ?",
+                self._row(record)[1:] + (str(uid),),
+            )
+        self.writes += 1
+        return record
+
+    def find_name(self, name: str) -> list:
+        key = name_key(name)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM users WHERE dispname_key = ? UNION SELECT data FROM users WHERE username_key = ?",
+                (key, key),
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def find_prefix(self, prefix: str, limit: int = 25) -> list:
+        key = name_key(prefix)
+        if not key:
+            return []
+        bounds = (key, key + PREFIX_END)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM ("
+                "SELECT id, data FROM users WHERE dispname_key >= ? AND dispname_key < ? "
+                "UNION SELECT id, data FROM users WHERE username_key >= ? AND username_key < ?"
+                ") ORDER BY id LIMIT ?",
+                bounds + bounds + (limit,),
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM users").fetchone()[0]
+
+    @property
+    def last_saved(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'last_saved'").fetchone()
+        return row[0] if row else None
+
+    @last_saved.setter
+    def last_saved(self, value):
+        self._write("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_saved', ?)", (value,))
+
+    def snapshot(self) -> dict:
+        """Everything, in the uinfo.json layout (reads every row)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, data FROM users ORDER BY id").fetchall()
+        return {"discord_users": {uid: json.loads(data) for uid, data in rows}, "last_saved": self.last_saved}
+
+    def encoded_items(self) -> list:
+        with self._lock:
+            return self._conn.execute("SELECT id, data FROM users ORDER BY id").fetchall()
+
+    def import_json(self, data: dict):
+        """One-time migration from a uinfo.json dict."""
+        self.put_many(dict(record, id=uid) for uid, record in data.get("discord_users", {}).items())
+        if data.get("last_saved"):
+            self.last_saved = data["last_saved"]
+
+    # Same lifecycle as JsonUserStore; every write is already committed
+    def start(self):
+        pass
+
+    def flush(self) -> bool:
+        return False
+
+    def stop(self):
+        with self._lock:
+            self._conn.close()